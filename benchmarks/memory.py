@@ -0,0 +1,68 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Memory used by the default and compact layouts of CE neurons and words.
+
+Run from the root of the repository with:
+
+    python -m benchmarks.memory
+"""
+
+import sys
+
+from cognon_extended import Neuron
+from cognon_extended import Word
+from cognon_extended import WordSet
+
+
+def wordset_bytes(wordset):
+    """Returns the number of bytes of the arrays of a WordSet.
+    """
+    return wordset.synapse_offsets.nbytes + wordset.synapse_delays.nbytes + \
+           wordset.indptr.nbytes
+
+
+def measure(S0=10000, num_active=220, C=10, D1=4, D2=7, G=1.5,
+            num_words=10000):
+    """Measures the memory used per neuron and per word by both layouts.
+
+    Returns:
+        A list of (layout, bytes per neuron, bytes per word) tuples.
+    """
+    results = []
+    for compact in (False, True):
+        neuron = Neuron(S0, 5.0, G, C, D1, D2, compact=compact)
+        wordset = WordSet(num_words, S0, D1, num_active, compact=compact)
+        results.append(('compact' if compact else 'default',
+                        neuron.synapses.nbytes,
+                        wordset_bytes(wordset) / float(num_words)))
+    return results
+
+
+def main():
+    S0, num_active = 10000, 220
+    print 'S0 = %d, %d active synapses per word' % (S0, num_active)
+    print '%-8s %16s %16s' % ('layout', 'bytes/neuron', 'bytes/word')
+    for layout, neuron_bytes, word_bytes in measure(S0, num_active):
+        print '%-8s %16d %16.1f' % (layout, neuron_bytes, word_bytes)
+    print 'Word instance: %d bytes (no __dict__)' % sys.getsizeof(Word())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Benchmark suite of the neuron models and the experiment driver.
+
+Every benchmark is a function that takes its parameters, does its setup and
+returns the callable to time. Benchmarks are run for every combination of
+their parameter values, and the timings are saved as JSON so that runs on
+different commits can be compared. Run from the root of the repository with:
+
+    python -m benchmarks.suite -o results.json
+    python -m benchmarks.suite -k extended -o new.json --compare results.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import re
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import cognon_basic
+import cognon_extended
+import create_tables
+import kernels
+from run_experiment import Cognon
+from run_experiment import Workers
+
+
+# Registered benchmarks, as (name, function, parameter grid) tuples
+BENCHMARKS = []
+
+# Minimum duration of a timing sample, in seconds
+MIN_SAMPLE_TIME = 0.2
+
+
+def benchmark(**grid):
+    """Registers a benchmark function with the given parameter grid.
+
+    Args:
+        grid: Lists of values of each parameter of the function.
+    """
+    def register(func):
+        BENCHMARKS.append((func.__name__, func, grid))
+        return func
+    return register
+
+
+def parameters(grid):
+    """Yields every combination of the values of a parameter grid.
+    """
+    names = sorted(grid)
+    for values in itertools.product(*[grid[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+@benchmark(S0=[100, 1000, 10000], num_active=[10, 100])
+def basic_expose(S0, num_active):
+    neuron = cognon_basic.Neuron(S0, 5.0, 2.0)
+    word = cognon_basic.WordSet(1, S0, num_active).words[0]
+    return lambda: neuron.expose(word)
+
+
+@benchmark(S0=[100, 1000, 10000], num_active=[10, 100])
+def basic_expose_many(S0, num_active):
+    neuron = cognon_basic.Neuron(S0, 5.0, 2.0)
+    wordset = cognon_basic.WordSet(10000, S0, num_active)
+    return lambda: neuron.expose_many(wordset, 'numpy')
+
+
+@benchmark(S0=[200, 2000], C=[1, 10], D1=[1, 4], D2=[1, 7])
+def extended_expose(S0, C, D1, D2):
+    neuron = cognon_extended.Neuron(S0, 5.0, 2.0, C, D1, D2)
+    word = cognon_extended.WordSet(1, S0, D1, S0 // 10).words[0]
+    return lambda: neuron.expose(word)
+
+
+@benchmark(S0=[200, 2000], C=[1, 10], D1=[1, 4], D2=[1, 7])
+def extended_expose_many(S0, C, D1, D2):
+    neuron = cognon_extended.Neuron(S0, 5.0, 2.0, C, D1, D2)
+    wordset = cognon_extended.WordSet(10000, S0, D1, S0 // 10)
+    return lambda: neuron.expose_many(wordset)
+
+
+@benchmark(S0=[200, 2000], C=[1, 10], D1=[1, 4], D2=[1, 7],
+           backend=['numpy', 'numba', 'batched'])
+def extended_train(S0, C, D1, D2, backend):
+    if backend == 'numba' and kernels.numba is None:
+        return None
+    wordset = cognon_extended.WordSet(100, S0, D1, S0 // 10)
+    template = cognon_extended.Neuron(S0, 5.0, 2.0, C, D1, D2)
+
+    def train():
+        neuron = cognon_extended.Neuron(S0, 5.0, 2.0, C, D1, D2)
+        neuron.synapses = template.synapses.copy()
+        neuron.start_training()
+        if backend == 'batched':
+            neuron.train_batched(wordset)
+        else:
+            neuron.train_many(wordset, backend)
+    return train
+
+
+@benchmark(S0=[200, 10000], num_active=[10, 100])
+def wordset_fixed(S0, num_active):
+    return lambda: cognon_extended.WordSet(10000, S0, 4, num_active)
+
+
+@benchmark(S0=[200, 10000], R=[10, 100])
+def wordset_binomial(S0, R):
+    return lambda: cognon_extended.WordSet(10000, S0, 4, None, R)
+
+
+@benchmark(row=[(5, 1.9, 1000, 333, 300)], repetitions=[2])
+def table23_row(row, repetitions):
+    def run():
+        config = create_tables.table23_config(*row)
+        config.seed = create_tables.row_seed(row)
+        with Workers(processes=1) as workers:
+            Cognon().run_configuration(config, repetitions, workers)
+    return run
+
+
+def measure(func, repeat=5, min_time=MIN_SAMPLE_TIME):
+    """Times a callable.
+
+    The number of calls per sample is doubled until a sample takes at least
+    min_time, and then repeat samples are timed.
+
+    Returns:
+        A dict with the number of calls per sample and the best, median and
+        mean time per call, in seconds.
+    """
+    number = 1
+    while True:
+        start = time.time()
+        for i in xrange(number):
+            func()
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    samples = [elapsed / number]
+    for i in xrange(repeat - 1):
+        start = time.time()
+        for j in xrange(number):
+            func()
+        samples.append((time.time() - start) / number)
+
+    return {'number': number, 'repeat': repeat, 'best': min(samples),
+            'median': float(np.median(samples)), 'mean': float(np.mean(samples))}
+
+
+def environment():
+    """Returns a description of the machine and code being benchmarked.
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'machine': platform.node(),
+            'processor': platform.processor(),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'numba': kernels.numba.__version__ if kernels.numba else None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def run(pattern=None, repeat=5, min_time=MIN_SAMPLE_TIME, out=sys.stdout):
+    """Runs the benchmarks whose name matches a regular expression.
+
+    Args:
+        pattern: Regular expression to select the benchmarks, None for all.
+        repeat: Number of timing samples of each benchmark.
+        min_time: Minimum duration of a timing sample, in seconds.
+        out: Stream to report the progress to, None to be quiet.
+
+    Returns:
+        A dict with the environment and the list of timings.
+    """
+    results = []
+    for name, func, grid in BENCHMARKS:
+        if pattern is not None and not re.search(pattern, name):
+            continue
+        for params in parameters(grid):
+            target = func(**params)
+            if target is None: # Not available in this environment
+                continue
+            timing = measure(target, repeat, min_time)
+            timing.update({'name': name, 'params': params})
+            results.append(timing)
+            if out is not None:
+                print >>out, '%-22s %-50s %12.6f s' % (name, key(timing)[1],
+                                                       timing['best'])
+    return {'environment': environment(), 'results': results}
+
+
+def key(timing):
+    """Returns a hashable identifier of a benchmark and its parameters.
+    """
+    return timing['name'], json.dumps(timing['params'], sort_keys=True)
+
+
+def compare(new, old, threshold=1.2):
+    """Compares two runs, benchmark by benchmark.
+
+    Args:
+        new: Results of run() to check.
+        old: Results of run() to compare with.
+        threshold: Ratio of best times above which a benchmark regressed.
+
+    Returns:
+        A list of (name, params, ratio) tuples of the regressed benchmarks.
+    """
+    old_best = dict((key(t), t['best']) for t in old['results'])
+    regressions = []
+    for t in new['results']:
+        name, params = key(t)
+        if (name, params) in old_best:
+            ratio = t['best'] / old_best[name, params]
+            if ratio > threshold:
+                regressions.append((name, params, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', dest='pattern',
+                        help='only run benchmarks matching this regex')
+    parser.add_argument('-o', dest='output', help='save the results as JSON')
+    parser.add_argument('-r', dest='repeat', type=int, default=5,
+                        help='number of timing samples (default: 5)')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='report regressions against a previous run')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio of a regression (default: 1.2)')
+    args = parser.parse_args(argv)
+
+    results = run(args.pattern, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, params, ratio in regressions:
+            print '[REGRESSION] %s %s: %.2fx slower' % (name, params, ratio)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
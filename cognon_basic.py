@@ -17,7 +17,64 @@
 # limitations under the License.
 #
 
+from fractions import Fraction
 import numpy as np
+import random
+
+import kernels
+
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in xrange(256)], dtype=np.uint8)
+
+
+def popcount(bits):
+    """Returns the number of set bits of each row of a packed bit array.
+
+    Args:
+        bits: Array of uint8 of shape (..., num_bytes), as returned by
+            np.packbits.
+    """
+    return _POPCOUNT[bits].sum(axis=-1, dtype=int)
+
+
+def _choose(n, k):
+    """Returns the binomial coefficient C(n, k) as an exact integer.
+    """
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    c = 1
+    for i in xrange(k):
+        c = c * (n - i) // (i + 1)
+    return c
+
+
+def false_positive_rate(S0, H, G, num_active, num_strong):
+    """Computes the exact false positive rate of a trained CB neuron.
+
+    A random word of num_active distinct synapses hits a number x of strong
+    synapses that follows a hypergeometric distribution, and the neuron fires
+    if its weighted sum num_active + (G-1)*x meets H*G, see kernels.fires().
+    The rate is the tail of the distribution over the x that fire the
+    neuron.
+
+    Args:
+        S0: Number of synapses.
+        H: Number of synapses needed to fire a neuron.
+        G: Ratio of strong synapse strength to weak synapse strength.
+        num_active: Number of active synapses per word.
+        num_strong: Number of strong synapses of the neuron.
+
+    Returns:
+        The probability that the neuron fires for a random word.
+    """
+    hits = 0
+    for x in xrange(min(num_active, num_strong) + 1):
+        if kernels.fires(num_active, x, G, H*G):
+            hits += _choose(num_strong, x) * \
+                    _choose(S0 - num_strong, num_active - x)
+    return float(Fraction(hits, _choose(S0, num_active)))
 
 
 class Word(object):
@@ -41,6 +98,119 @@ class Word(object):
 
 
 
+class WordSet(object):
+    """An array of Words.
+
+    Wordset stores the synapses of all its words in a flat array, CSR style:
+    the synapses of the i-th word are those in the range
+    indptr[i]:indptr[i+1] of offsets.
+
+    Attributes:
+        words: List of Word instances.
+        offsets: Offsets of the fired synapses of all the words.
+        indptr: Index of the first synapse of each word, plus the total
+            number of synapses.
+    """
+
+    def __init__(self, num_words, word_length, num_active, rng=None):
+        """Inits WordSet class.
+
+       Args:
+           num_words: Number of Words to initialize the WordSet with.
+           word_length: Number of synapses in a Word.
+           num_active: Number of active synapses per word.
+           rng: NumPy RandomState to draw the words from. Defaults to the
+                global random state.
+       """
+        if rng is None:
+            sampler = random
+        else:
+            sampler = random.Random(rng.randint(2**31 - 1))
+
+        synapses = range(word_length)
+        self.indptr = np.arange(num_words + 1) * num_active
+        self.offsets = np.fromiter(
+                (s for i in xrange(num_words)
+                   for s in sampler.sample(synapses, num_active)),
+                dtype=int, count=self.indptr[-1])
+
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+
+    @property
+    def words(self):
+        return [Word(self.offsets[self.indptr[i]:self.indptr[i+1]])
+                for i in xrange(len(self))]
+
+
+    @words.setter
+    def words(self, words):
+        """Replaces the contents of the WordSet with a list of Words.
+        """
+        self.indptr = np.zeros(len(words) + 1, dtype=int)
+        np.cumsum([len(w.offset) for w in words], out=self.indptr[1:])
+        self.offsets = np.array([s for w in words for s in w.offset],
+                                dtype=int)
+
+
+    def pack(self, word_length):
+        """Returns the words of the WordSet as a PackedWordSet.
+
+        Args:
+            word_length: Number of synapses in a Word.
+        """
+        return PackedWordSet.from_wordset(self, word_length)
+
+
+
+class PackedWordSet(object):
+    """An array of Words stored as packed bitmasks.
+
+    The i-th row of bits has the bit of every synapse that fired for the
+    i-th word set, so each word takes word_length/8 bytes whatever its number
+    of active synapses. This is smaller than a WordSet when words have more
+    than word_length/64 active synapses.
+
+    Attributes:
+        bits: Array of uint8 of shape (num_words, ceil(word_length/8)).
+        word_length: Number of synapses in a Word.
+    """
+
+    def __init__(self, bits, word_length):
+        """Inits PackedWordSet class.
+
+        Args:
+            bits: Packed bitmasks of the words, see np.packbits.
+            word_length: Number of synapses in a Word.
+        """
+        self.bits = np.asarray(bits, dtype=np.uint8)
+        self.word_length = word_length
+
+
+    @classmethod
+    def from_wordset(cls, wordset, word_length):
+        """Packs the words of a WordSet.
+        """
+        num_bytes = (word_length + 7) // 8
+        mask = np.zeros((len(wordset), num_bytes * 8), dtype=bool)
+        rows = np.repeat(np.arange(len(wordset)), np.diff(wordset.indptr))
+        mask[rows, wordset.offsets] = True
+        return cls(np.packbits(mask, axis=1), word_length)
+
+
+    def __len__(self):
+        return len(self.bits)
+
+
+    @property
+    def words(self):
+        mask = np.unpackbits(self.bits, axis=1)[:, :self.word_length]
+        return [Word(np.flatnonzero(row)) for row in mask]
+
+
+
 class Neuron(object):
     """Models a CB neuron.
 
@@ -84,11 +254,9 @@ class Neuron(object):
            A Boolean indicating whether the neuron will fire or not.
        """
         # Compute the weighted sum of the firing inputs
-        s = self.strength[list(w.offset)].sum()
-        if self.training:
-            return s >= self.H
-        else:
-            return s >= self.H*self.G
+        offsets = list(w.offset)
+        strong = np.count_nonzero(self.strength[offsets] != 1.0)
+        return kernels.fires(len(offsets), strong, self.G, self._threshold)
 
 
     def train(self, w):
@@ -116,6 +284,80 @@ class Neuron(object):
         return True
 
 
+    def expose_many(self, wordset, backend=None):
+        """Presents every word of a WordSet to the neuron.
+
+        The strong synapses of all the words are counted with a single
+        bincount pass.
+
+        Args:
+            wordset: A WordSet to present to the neuron.
+            backend: Kernel backend to use, see the kernels module. Defaults
+                to Numba if it is installed and NumPy otherwise.
+
+        Returns:
+            An array of Booleans indicating whether the neuron fired or not
+            for each word.
+        """
+        backend = kernels.resolve_backend(backend)
+        if backend != 'numpy':
+            fired = np.zeros(len(wordset), dtype=bool)
+            kernel = kernels.get_kernel('expose_basic', backend)
+            kernel(self.strength, wordset.offsets, wordset.indptr, self.H,
+                   self.G, self.training, fired)
+            return fired
+
+        lengths = np.diff(wordset.indptr)
+        rows = np.repeat(np.arange(len(wordset)), lengths)
+        strong = np.bincount(rows,
+                             weights = self.strength[wordset.offsets] != 1.0,
+                             minlength = len(wordset))
+        return kernels.fires(lengths, strong, self.G, self._threshold)
+
+
+    def train_many(self, wordset, backend=None):
+        """Trains the neuron with every word of a WordSet, in order.
+
+        Args:
+            wordset: A WordSet to train the neuron with.
+            backend: Kernel backend to use, see the kernels module. Defaults
+                to Numba if it is installed and NumPy otherwise.
+
+        Returns:
+            An array of Booleans indicating whether the neuron fired or not
+            for each word.
+        """
+        if not self.training:
+            print "[WARN] train(w) was called when not in training mode."
+            return np.zeros(len(wordset), dtype=bool)
+
+        backend = kernels.resolve_backend(backend)
+        if backend == 'numpy':
+            return np.array([self.train(w) for w in wordset.words],
+                            dtype=bool)
+
+        fired = np.zeros(len(wordset), dtype=bool)
+        kernel = kernels.get_kernel('train_basic', backend)
+        kernel(self.strength, wordset.offsets, wordset.indptr, self.H,
+               self.G, fired)
+        return fired
+
+
+    def false_positive_rate(self, num_active):
+        """Computes the exact probability that the neuron fires for a random
+        word of num_active synapses, see false_positive_rate().
+       """
+        num_strong = np.count_nonzero(self.strength != 1.0)
+        return false_positive_rate(self.S0, self.H, self.G, num_active,
+                                   num_strong)
+
+
+    @property
+    def _threshold(self):
+        # Weighted sum needed to fire, see kernels.fires()
+        return self.H if self.training else self.H*self.G
+
+
     def start_training(self):
         """Set the neuron in training mode.
        """
@@ -130,3 +372,139 @@ class Neuron(object):
        """
         self.training = False
 
+
+
+class PackedNeuron(Neuron):
+    """Models a CB neuron whose synapse strengths are stored as a bit array.
+
+    Synapse strengths are either 1 or G, so a neuron only needs one bit per
+    synapse to tell the strong synapses apart. A word w fires the neuron as
+    in Neuron, with popcount(w) active synapses, popcount(w & strong) of
+    them strong.
+
+    Attributes:
+        strong: Packed bit array of the strong synapses.
+    """
+
+    def __init__(self, S0 = 16, H = 4.0, G = 2.0):
+        """Inits PackedNeuron class.
+
+        Args:
+            S0: Number of synapses.
+            H: Number of synapses needed to fire a neuron.
+            G: Ratio of strong synapse strength to weak synapse strength,
+                binary approximation.
+        """
+        self.S0 = S0
+        self.H = H
+        self.G = G
+        self.strong = np.zeros((S0 + 7) // 8, dtype=np.uint8)
+        self.training = False
+
+
+    @property
+    def strength(self):
+        """A read-only copy of the synapse strengths, as in Neuron.
+        """
+        mask = np.unpackbits(self.strong)[:self.S0]
+        return np.where(mask, float(self.G), 1.0)
+
+
+    def expose(self, w):
+        """Models how the neuron reacts to excitation patterns, see
+        Neuron.expose().
+
+        Args:
+            w: A Word to present to the neuron.
+
+        Returns:
+            A Boolean indicating whether the neuron will fire or not.
+        """
+        return bool(self._fires(self._pack(w)))
+
+
+    def train(self, w):
+        """Trains a neuron with an input word, see Neuron.train().
+
+        Args:
+            w: A Word to train the neuron with.
+
+        Returns:
+            A Boolean indicating whether the neuron fired or not.
+        """
+        if not self.training:
+            print "[WARN] train(w) was called when not in training mode."
+            return False
+
+        bits = self._pack(w)
+        if not self._fires(bits): return False
+
+        # Set the srength for participating synapses to G
+        self.strong |= bits
+
+        return True
+
+
+    def expose_many(self, wordset, backend=None):
+        """Presents every word of a WordSet to the neuron.
+
+        Args:
+            wordset: A PackedWordSet, or a WordSet that is packed first.
+            backend: Ignored, the packed sums are always computed with NumPy.
+
+        Returns:
+            An array of Booleans indicating whether the neuron fired or not
+            for each word.
+        """
+        if not isinstance(wordset, PackedWordSet):
+            wordset = wordset.pack(self.S0)
+        return self._fires(wordset.bits)
+
+
+    def train_many(self, wordset, backend=None):
+        """Trains the neuron with every word of a WordSet, in order.
+
+        Args:
+            wordset: A PackedWordSet, or a WordSet that is packed first.
+            backend: Ignored, the packed sums are always computed with NumPy.
+
+        Returns:
+            An array of Booleans indicating whether the neuron fired or not
+            for each word.
+        """
+        if not self.training:
+            print "[WARN] train(w) was called when not in training mode."
+            return np.zeros(len(wordset), dtype=bool)
+
+        if not isinstance(wordset, PackedWordSet):
+            wordset = wordset.pack(self.S0)
+
+        fired = np.zeros(len(wordset), dtype=bool)
+        for i, bits in enumerate(wordset.bits):
+            fired[i] = self._fires(bits)
+            if fired[i]:
+                self.strong |= bits
+        return fired
+
+
+    def false_positive_rate(self, num_active):
+        """Computes the exact probability that the neuron fires for a random
+        word of num_active synapses, see false_positive_rate().
+       """
+        # The binomial coefficients overflow with NumPy integers
+        return false_positive_rate(self.S0, self.H, self.G, num_active,
+                                   int(popcount(self.strong)))
+
+
+    def _pack(self, w):
+        offsets = np.fromiter(w.offset, dtype=int, count=len(w.offset))
+        if len(offsets) > 0 and offsets.max() >= self.S0:
+            raise IndexError('offset out of range')
+        mask = np.zeros(len(self.strong) * 8, dtype=bool)
+        mask[offsets] = True
+        return np.packbits(mask)
+
+
+    def _fires(self, bits):
+        return kernels.fires(popcount(bits), popcount(bits & self.strong),
+                             self.G, self._threshold)
@@ -18,8 +18,110 @@
 #
 
 from collections import namedtuple
+import json
 import numpy as np
-import random
+import os
+
+import kernels
+
+
+# Number of words presented at once by Neuron.expose_many
+EXPOSE_BLOCK_WORDS = 65536
+
+# Default number of words generated at once by a WordStream
+STREAM_CHUNK_WORDS = 100000
+
+# Maximum number of words trained at once by Neuron.train_batched
+TRAIN_BLOCK_WORDS = 1024
+
+# Maximum number of random keys drawn at once by sample_offsets
+SAMPLE_BLOCK_KEYS = 2**22
+
+# Record layouts of the synapses of neurons and words. The compact layouts
+# take 4 bytes per neuron synapse and 3 bytes per word synapse, and limit S0
+# to 65536 and C, D1 and D2 to 256.
+SYNAPSE_DTYPE = 'float32,uint16,uint16'
+COMPACT_SYNAPSE_DTYPE = 'float16,uint8,uint8'
+COMPACT_OFFSET_DTYPE = np.uint16
+COMPACT_DELAY_DTYPE = np.uint8
+
+
+def sample_offsets(N_array, word_length, rng=None):
+    """Draws the distinct synapse offsets of many words at once.
+
+    Words with more than half of the synapses active take the first offsets
+    of a random permutation, obtained by sorting random keys. The others
+    draw their offsets with replacement and draw the repeated ones again
+    until they are all distinct, which leaves them sorted. Neither method
+    depends on the offset values, so every subset of offsets is equally
+    likely. Words are processed in blocks of about SAMPLE_BLOCK_KEYS values.
+
+    Args:
+        N_array: Array with the number of active synapses of each word.
+        word_length: Number of synapses in a Word.
+        rng: NumPy RandomState to draw the offsets from. Defaults to the
+            global random state.
+
+    Returns:
+        The offsets of all the words, CSR style.
+    """
+    if rng is None:
+        rng = np.random
+
+    N_array = np.asarray(N_array, dtype=int)
+    offsets = np.empty(N_array.sum(), dtype=int)
+
+    dense = 2 * N_array > word_length
+    for mask, sample in ((dense, _sample_dense), (~dense, _sample_sparse)):
+        N = N_array[mask]
+        if len(N) == 0:
+            continue
+        width = max(word_length if sample is _sample_dense else N.max(), 1)
+        block = max(1, SAMPLE_BLOCK_KEYS // width)
+
+        # Write the blocks in place when all the words are of the same kind
+        target = offsets if mask.all() else np.empty(N.sum(), dtype=int)
+        position = 0
+        for start in xrange(0, len(N), block):
+            sampled = sample(N[start:start+block], word_length, rng)
+            target[position:position+len(sampled)] = sampled
+            position += len(sampled)
+        if target is not offsets:
+            offsets[np.repeat(mask, N_array)] = target
+
+    return offsets
+
+
+def _sample_dense(N, word_length, rng):
+    keys = rng.random_sample((len(N), word_length))
+    return keys.argsort(axis=1)[np.arange(word_length) < N[:, None]]
+
+
+def _sample_sparse(N, word_length, rng):
+    # Pad the rows with distinct values above any offset, so they sort last
+    columns = np.arange(N.max())
+    padding = columns >= N[:, None]
+    offsets = rng.randint(word_length, size=padding.shape)
+    offsets[padding] = np.broadcast_to(word_length + columns,
+                                       padding.shape)[padding]
+
+    offsets.sort(axis=1)
+    pending = np.arange(len(N))
+    redraw = offsets
+    while True:
+        repeated = redraw[:, 1:] == redraw[:, :-1]
+        incomplete = repeated.any(axis=1)
+        if not incomplete.any():
+            break
+        pending = pending[incomplete]
+        redraw = redraw[incomplete]
+        redraw[:, 1:][repeated[incomplete]] = rng.randint(
+                word_length, size=np.count_nonzero(repeated))
+        redraw.sort(axis=1)
+        offsets[pending] = redraw
+
+    return offsets[~padding]
+
 
 
 class Synapse(namedtuple('Synapse', ['offset', 'delay'])):
@@ -31,7 +133,7 @@ class Synapse(namedtuple('Synapse', ['offset', 'delay'])):
         delay: Represents the time the signal takes to traverse the axon to
         reach the synapse. Takes a value in range(D1).
     """
-    pass
+    __slots__ = ()
 
 
 
@@ -43,9 +145,12 @@ class Word(object):
     most recent given excitation pattern.
 
     Attributes:
-        synapses: A set of pairs containing the syanpses that fired and the
-            associated delay.
+        offsets: Array with the offsets of the synapses that fired.
+        delays: Array with the delay associated to each fired synapse.
+        synapses: A list of Synapse pairs containing the synapses that fired
+            and the associated delay.
     """
+    __slots__ = ('offsets', 'delays')
 
     def __init__(self, fired_syn=[]):
         """Inits Word class.
@@ -57,23 +162,54 @@ class Word(object):
         """
         if len(fired_syn) > 0 and sorted(fired_syn)[0][0] < 0:
             raise ValueError('synapse offset values have to be positive')
-        self.synapses = [Synapse(*s) for s in fired_syn]
+        self.offsets = np.array([s[0] for s in fired_syn], dtype=int)
+        self.delays = np.array([s[1] for s in fired_syn], dtype=int)
+
+
+    @classmethod
+    def from_arrays(cls, offsets, delays):
+        """Builds a Word on top of existing offset and delay arrays.
+
+        The arrays are not copied, so the Word is a view of them.
+        """
+        w = cls.__new__(cls)
+        w.offsets = offsets
+        w.delays = delays
+        return w
+
+
+    @property
+    def synapses(self):
+        return [Synapse(*s) for s in zip(self.offsets.tolist(),
+                                         self.delays.tolist())]
 
 
 
 class WordSet(object):
     """An array of Words.
 
-    Wordset is simply an array of Word instances, which may also store
-    information regarding the delay slot learned for the word during training.
+    Wordset stores the synapses of all its words in flat arrays, CSR style:
+    the synapses of the i-th word are those in the range
+    indptr[i]:indptr[i+1] of synapse_offsets and synapse_delays. It may also
+    store information regarding the delay slot learned for the word during
+    training.
 
     Attributes:
-        words: Array of Word instances.
+        words: Sequence of Word instances, views of the synapse arrays.
+        synapse_offsets: Offsets of the fired synapses of all the words.
+        synapse_delays: Delays of the fired synapses of all the words.
+        indptr: Index of the first synapse of each word, plus the total
+            number of synapses.
         delays: Delay slots learned for each word during training.
+        word_length: Number of synapses in a Word, or None if unknown.
+        num_delays: Number of delay slots, or None if unknown.
     """
 
+    # Arrays stored by save(), in the order of the from_arrays() arguments
+    _ARRAYS = ('synapse_offsets', 'synapse_delays', 'indptr')
+
     def __init__(self, num_words, word_length, num_delays, num_active=None,
-                       refractory_period=None):
+                       refractory_period=None, rng=None, compact=False):
         """Inits WordSet class.
 
        Args:
@@ -83,7 +219,18 @@ class WordSet(object):
            num_active: Number of active synapses per word.
            refractory_period: Average number of different patterns presented
                               before a given neuron fires.
+           rng: NumPy RandomState to draw the words from. Defaults to the
+                global random state.
+           compact: Whether to store the synapse offsets and delays with the
+                    compact dtypes, 3 bytes per synapse instead of 16.
        """
+        if compact and (word_length > 2**16 or num_delays > 2**8):
+            raise ValueError('compact words need word_length <= 65536 and '
+                             'num_delays <= 256')
+
+        if rng is None:
+            rng = np.random
+
         # Distribution of the number of active synapses per word?
         if num_active != None:
             # fixed: N
@@ -92,15 +239,310 @@ class WordSet(object):
         else:
             # binomial: B(S0, R/S0)
             R_S0 = refractory_period/float(word_length) # R/S0
-            N_array = np.random.binomial(word_length, R_S0, num_words)
+            N_array = rng.binomial(word_length, R_S0, num_words)
 
         # Generate the set of words and set delays to 0
-        synapses = range(word_length)
-        self.words = [Word(zip(
-                random.sample(synapses, N),              # active synapses
-                np.random.randint(num_delays, size=N)))  # active delays
-            for N in N_array]
+        self.indptr = np.zeros(num_words + 1, dtype=int)
+        np.cumsum(N_array, out=self.indptr[1:])
+        self.synapse_offsets = sample_offsets(N_array, word_length,
+                                              rng)        # active synapses
+        self.synapse_delays = rng.randint(num_delays,
+                size=self.indptr[-1])                     # active delays
         self.delays = [0] * num_words
+        self.word_length = word_length
+        self.num_delays = num_delays
+        self._index = None
+
+        if compact:
+            self.synapse_offsets = \
+                    self.synapse_offsets.astype(COMPACT_OFFSET_DTYPE)
+            self.synapse_delays = \
+                    self.synapse_delays.astype(COMPACT_DELAY_DTYPE)
+
+
+    @classmethod
+    def from_arrays(cls, synapse_offsets, synapse_delays, indptr,
+                    word_length=None, num_delays=None):
+        """Builds a WordSet on top of existing CSR synapse arrays.
+
+        The arrays are not copied, so the WordSet is a view of them.
+        """
+        ws = cls.__new__(cls)
+        ws.synapse_offsets = synapse_offsets
+        ws.synapse_delays = synapse_delays
+        ws.indptr = indptr
+        ws.delays = [0] * (len(indptr) - 1)
+        ws.word_length = word_length
+        ws.num_delays = num_delays
+        ws._index = None
+        return ws
+
+
+    def save(self, path):
+        """Saves the synapse arrays of the WordSet as .npy files, and its
+        word_length and num_delays as JSON.
+
+        Args:
+            path: Directory to store the arrays in. Created if it does not
+                exist.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in self._ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'wordset.json'), 'w') as f:
+            json.dump({'word_length': self.word_length,
+                       'num_delays': self.num_delays}, f)
+
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Opens a WordSet stored with save().
+
+        Args:
+            path: Directory where the arrays are stored.
+            mmap: Whether to map the arrays read-only instead of loading
+                them, so that processes opening the same WordSet share its
+                memory through the page cache.
+        """
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(path, name + '.npy'),
+                          mmap_mode=mmap_mode) for name in cls._ARRAYS]
+        try:
+            with open(os.path.join(path, 'wordset.json')) as f:
+                meta = json.load(f)
+        except IOError:
+            meta = {} # Saved before the metadata was stored
+        return cls.from_arrays(*arrays,
+                               word_length=meta.get('word_length'),
+                               num_delays=meta.get('num_delays'))
+
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+
+    def slice(self, start, stop):
+        """Returns a WordSet with the words in range(start, stop).
+
+        The synapse arrays are shared with this WordSet.
+        """
+        stop = min(stop, len(self))
+        indptr = self.indptr[start:stop+1]
+        syn = slice(indptr[0], indptr[-1])
+        return WordSet.from_arrays(self.synapse_offsets[syn],
+                                   self.synapse_delays[syn],
+                                   indptr - indptr[0], self.word_length,
+                                   self.num_delays)
+
+
+    def take(self, indices):
+        """Returns a WordSet with the words of the given indices, in order.
+
+        The synapse arrays are copied.
+        """
+        indices = np.asarray(indices, dtype=int)
+        starts = self.indptr[indices]
+        lengths = self.indptr[indices + 1] - starts
+        indptr = np.zeros(len(indices) + 1, dtype=int)
+        np.cumsum(lengths, out=indptr[1:])
+        syn = _ranges(starts, lengths)
+        return WordSet.from_arrays(self.synapse_offsets[syn],
+                                   self.synapse_delays[syn], indptr,
+                                   self.word_length, self.num_delays)
+
+
+    def inverted_index(self, word_length):
+        """Returns the inverted index of the WordSet, from synapse offsets to
+        the words that contain them.
+
+        The index is built on first use and kept with the WordSet, so it
+        pays off when the same words are presented to several neurons.
+
+        Args:
+            word_length: Number of synapses in a Word.
+
+        Returns:
+            A 2-element tuple of arrays (indptr, words), where
+            words[indptr[o]:indptr[o+1]] are the sorted indices of the words
+            that contain the synapse offset o.
+        """
+        if self._index is None or len(self._index[0]) != word_length + 1:
+            # Sorting (offset, word) keys is faster than a stable argsort
+            num_words = max(len(self), 1)
+            keys = self.synapse_offsets.astype(int) * num_words + \
+                   np.repeat(np.arange(len(self)), np.diff(self.indptr))
+            keys.sort()
+            words = keys % num_words
+            indptr = np.zeros(word_length + 1, dtype=int)
+            np.cumsum(np.bincount(self.synapse_offsets,
+                                  minlength=word_length),
+                      out=indptr[1:])
+            self._index = (indptr, words)
+        return self._index
+
+
+    def chunks(self, chunk_size=None):
+        """Iterates over the WordSet in WordSets of at most chunk_size words.
+
+        If chunk_size is None, the whole WordSet is a single chunk.
+        """
+        if chunk_size is None:
+            yield self
+            return
+        for start in xrange(0, len(self), chunk_size):
+            yield self.slice(start, start + chunk_size)
+
+
+    @property
+    def words(self):
+        return WordList(self)
+
+
+    @words.setter
+    def words(self, words):
+        """Replaces the contents of the WordSet with a list of Words.
+        """
+        self.indptr = np.zeros(len(words) + 1, dtype=int)
+        np.cumsum([len(w.offsets) for w in words], out=self.indptr[1:])
+        self.synapse_offsets = np.concatenate(
+                [np.asarray(w.offsets, dtype=int) for w in words] + [[]]
+                ).astype(int)
+        self.synapse_delays = np.concatenate(
+                [np.asarray(w.delays, dtype=int) for w in words] + [[]]
+                ).astype(int)
+        self.delays = [0] * len(words)
+        self._index = None
+
+
+
+class WordStream(object):
+    """A sequence of random words generated on the fly.
+
+    The words are generated in WordSet chunks of a fixed size, so that they
+    can be presented to a neuron and thrown away. The memory used does not
+    depend on the number of words.
+
+    Attributes:
+        num_words: Number of words in the stream.
+        chunk_size: Maximum number of words per chunk.
+    """
+
+    def __init__(self, num_words, word_length, num_delays, num_active=None,
+                       refractory_period=None, rng=None,
+                       chunk_size=STREAM_CHUNK_WORDS, compact=False):
+        """Inits WordStream class.
+
+       Args:
+           num_words: Number of Words in the stream.
+           word_length: Number of synapses in a Word.
+           num_delays: Number of delay slots.
+           num_active: Number of active synapses per word.
+           refractory_period: Average number of different patterns presented
+                              before a given neuron fires.
+           rng: NumPy RandomState to draw the words from. Defaults to the
+                global random state.
+           chunk_size: Maximum number of words per chunk.
+           compact: Whether to generate compact WordSets.
+       """
+        self.num_words = num_words
+        self.word_length = word_length
+        self.num_delays = num_delays
+        self.num_active = num_active
+        self.refractory_period = refractory_period
+        self.rng = rng
+        self.chunk_size = chunk_size
+        self.compact = compact
+
+
+    def __len__(self):
+        return self.num_words
+
+
+    def chunks(self):
+        """Generates the words of the stream, one WordSet at a time.
+        """
+        for start in xrange(0, self.num_words, self.chunk_size):
+            yield WordSet(min(self.chunk_size, self.num_words - start),
+                          self.word_length, self.num_delays, self.num_active,
+                          self.refractory_period, self.rng, self.compact)
+
+
+
+class WordList(object):
+    """Read-only sequence of the Words of a WordSet.
+
+    Each item is built on demand as a view of the WordSet synapse arrays.
+    """
+
+    def __init__(self, wordset):
+        self.wordset = wordset
+
+
+    def __len__(self):
+        return len(self.wordset)
+
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('word index out of range')
+        ws = self.wordset
+        start, stop = ws.indptr[i], ws.indptr[i+1]
+        return Word.from_arrays(ws.synapse_offsets[start:stop],
+                                ws.synapse_delays[start:stop])
+
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+
+
+def _bin_counts(rows, bins, strong, num_rows, num_bins):
+    """Counts the active and strong synapses of the (delay, container) bins
+    of several rows with a single bincount pass.
+
+    Args:
+        rows: Row (word or neuron) of each presented synapse.
+        bins: Bin of each presented synapse, in d-major, c-minor order.
+        strong: Whether each presented synapse is strong.
+        num_rows: Number of rows.
+        num_bins: Number of (delay, container) bins per row.
+
+    Returns:
+        A 2-element tuple of arrays of shape (num_rows, num_bins) with the
+        number of active synapses and of strong synapses of each bin.
+    """
+    # Bins out of range never fire, they are accumulated in an extra bin
+    bins = rows * (num_bins + 1) + np.minimum(bins, num_bins)
+    size = num_rows * (num_bins + 1)
+    n = np.bincount(bins, minlength = size)
+    k = np.bincount(bins[strong], minlength = size)
+    return (n.reshape(num_rows, num_bins + 1)[:, :num_bins],
+            k.reshape(num_rows, num_bins + 1)[:, :num_bins])
+
+
+def _ranges(starts, lengths):
+    """Returns the concatenation of the ranges of integers of the given
+    starts and lengths.
+    """
+    ends = np.cumsum(lengths)
+    return np.arange(ends[-1] if len(ends) else 0) + \
+           np.repeat(starts - (ends - lengths), lengths)
+
+
+def _first_fired(n, k, H, G, training):
+    """Finds the first bin of each row that meets the threshold, see
+    kernels.fires().
+
+    Returns:
+        A 2-element tuple of arrays containing whether each row has fired and
+        the index of its first fired bin.
+    """
+    above = kernels.fires(n, k, G, H if training else H*G)
+    return above.any(axis=1), above.argmax(axis=1)
 
 
 
@@ -126,7 +568,8 @@ class Neuron(object):
         training: whether the neuron is in training mode.
     """
 
-    def __init__(self, S0 = 200, H = 5.0, G = 2.0, C = 1, D1 = 4, D2 = 7):
+    def __init__(self, S0 = 200, H = 5.0, G = 2.0, C = 1, D1 = 4, D2 = 7,
+                 rng = None, compact = False):
         """Inits Neuron class.
 
         Args:
@@ -138,7 +581,21 @@ class Neuron(object):
             D1: Number of possible time slots where neurons can produce spikes.
             D2: Number of different time delays available between two neural
                 layers.
+            rng: NumPy RandomState to draw the synapse delays and containers
+                from. Defaults to the global random state.
+            compact: Whether to store the synapses with the compact record
+                layout, 4 bytes per synapse instead of 8. G has to be exactly
+                representable as a half precision float.
         """
+        if rng is None:
+            rng = np.random
+
+        if compact:
+            if C > 2**8 or D2 > 2**8:
+                raise ValueError('compact neurons need C and D2 <= 256')
+            if np.float16(G) != G:
+                raise ValueError('G is not representable in half precision')
+
         self.S0 = S0
         self.H = H
         self.G = G
@@ -146,11 +603,12 @@ class Neuron(object):
         self.D1 = D1
         self.D2 = D2
         self.training = False
-        self.synapses = np.zeros(S0, dtype='float32,uint16,uint16')
+        self.synapses = np.zeros(S0, dtype=COMPACT_SYNAPSE_DTYPE if compact
+                                           else SYNAPSE_DTYPE)
         self.synapses.dtype.names = ('strength', 'delay', 'container')
         self.synapses['strength'] = 1.0
-        self.synapses['delay'] = np.random.randint(D2, size=S0)
-        self.synapses['container'] = np.random.randint(C, size=S0)
+        self.synapses['delay'] = rng.randint(D2, size=S0)
+        self.synapses['container'] = rng.randint(C, size=S0)
 
 
     def expose(self, w):
@@ -162,6 +620,13 @@ class Neuron(object):
         the S0 element-by-element products of the most recent neuron vector and
         the current word.
 
+        The active and strong synapses of all the (delay, container) bins are
+        counted at once, and the neuron fires in the first bin that meets the
+        threshold, iterating over delays first and then over containers. The
+        weighted sum of a bin is compared with the threshold as in
+        kernels.fires(), so a sum that meets it in exact arithmetic fires
+        whatever the rounding of G.
+
         Args:
             w: A Word to present to the neuron.
 
@@ -171,26 +636,10 @@ class Neuron(object):
                 1. The delay in which the neuron has fired.
                 2. The container where the firing occurred.
         """
-        offsets = [syn.offset for syn in w.synapses]
-        delays  = [syn.delay  for syn in w.synapses]
-        synapses = self.synapses[offsets]
-
-        # Iterate over delays until neuron fires
-        for d in range(self.D1 + self.D2):
-            delay_indices = (synapses['delay'] + delays) == d
-
-            # Compute the weighted sum of the firing inputs for each container
-            for c in range(self.C):
-                container_indices = synapses['container'] == c
-                indices = delay_indices & container_indices
-                s = synapses['strength'][indices].sum()
-
-                # Check if the container has fired
-                if (self.training and s >= self.H) or s >= self.H*self.G:
-                    return (True, d, c)
-
-        # If no container has fired for any delay
-        return (False, None, None)
+        fired, first, bins = self._expose(w)
+        if not fired:
+            return (False, None, None)
+        return (True, first // self.C, first % self.C)
 
 
     def train(self, w):
@@ -210,25 +659,211 @@ class Neuron(object):
             print "[WARN] train(w) was called when not in training mode."
             return False
 
-        fired, delay, container = self.expose(w)
+        fired, first, bins = self._expose(w)
         if not fired: return False
 
         # Update the synapses that contributed to the firing
-        offsets = [s.offset for s in w.synapses]
-        delays  = [syn.delay  for syn in w.synapses]
+        self.synapses['strength'][w.offsets[bins == first]] = self.G
 
-        synapses = self.synapses[offsets]
+        return True
 
-        delay_indices = (synapses['delay'] + delays) == delay
-        container_indices = synapses['container'] == container
-        active_indices = delay_indices & container_indices
 
-        indices = np.zeros(self.S0, dtype=bool)
-        indices[offsets] = active_indices
+    def expose_many(self, wordset, backend=None, prefilter=False):
+        """Presents every word of a WordSet to the neuron.
 
-        self.synapses['strength'][indices] = self.G
+        The synapses of all the (word, delay, container) bins are counted
+        with bincount over blocks of words, so the words are never
+        looked at one by one.
 
-        return True
+        Args:
+            wordset: A WordSet to present to the neuron.
+            backend: Kernel backend to use, see the kernels module. Defaults
+                to Numba if it is installed and NumPy otherwise.
+            prefilter: Whether to present only the words that may fire, see
+                candidates(). Worth it when few synapses are strong and the
+                WordSet is presented to several neurons.
+
+        Returns:
+            A 3-element tuple of arrays with one item per word containing:
+                0. Booleans indicating whether the neuron fired or not.
+                1. The delay in which the neuron has fired, -1 if it has not.
+                2. The container where the firing occurred, -1 if it has not.
+        """
+        if prefilter:
+            candidates = np.flatnonzero(self.candidates(wordset))
+            if len(candidates) == len(wordset):
+                return self.expose_many(wordset, backend)
+            fired = np.zeros(len(wordset), dtype=bool)
+            delay = np.empty(len(wordset), dtype=int)
+            delay.fill(-1)
+            container = delay.copy()
+            fired[candidates], delay[candidates], container[candidates] = \
+                    self.expose_many(wordset.take(candidates), backend)
+            return fired, delay, container
+
+        num_words = len(wordset)
+        num_bins = (self.D1 + self.D2) * self.C
+        fired = np.zeros(num_words, dtype=bool)
+        first = np.zeros(num_words, dtype=int)
+
+        backend = kernels.resolve_backend(backend)
+        if backend != 'numpy':
+            kernel = kernels.get_kernel('expose_extended', backend)
+            kernel(self._kernel_strength(), self.synapses['delay'],
+                   self.synapses['container'], wordset.synapse_offsets,
+                   wordset.synapse_delays, wordset.indptr, self.H, self.G,
+                   self.C, num_bins, self.training, first)
+            fired = first >= 0
+        else:
+            for start in xrange(0, num_words, EXPOSE_BLOCK_WORDS):
+                stop = min(start + EXPOSE_BLOCK_WORDS, num_words)
+                indptr = wordset.indptr[start:stop+1]
+                syn = slice(indptr[0], indptr[-1])
+                offsets = wordset.synapse_offsets[syn]
+                synapses = self.synapses[offsets]
+
+                rows = np.repeat(np.arange(stop - start), np.diff(indptr))
+                bins = (synapses['delay'].astype(int) +
+                        wordset.synapse_delays[syn]) * self.C + \
+                       synapses['container']
+                n, k = _bin_counts(rows, bins, synapses['strength'] != 1.0,
+                                   stop - start, num_bins)
+                fired[start:stop], first[start:stop] = _first_fired(
+                        n, k, self.H, self.G, self.training)
+
+        delay = np.where(fired, first // self.C, -1)
+        container = np.where(fired, first % self.C, -1)
+        return fired, delay, container
+
+
+    def candidates(self, wordset):
+        """Finds the words of a WordSet that may fire the neuron.
+
+        No (delay, container) bin of a word has more active or strong
+        synapses than the whole word, so the words whose synapses do not
+        meet the threshold all together can not fire. The strong synapses
+        of each word are counted through the inverted index of the WordSet,
+        so the cost only depends on the number of words that contain a
+        strong synapse.
+
+        Args:
+            wordset: A WordSet.
+
+        Returns:
+            An array of Booleans, False for the words that can not fire the
+            neuron.
+        """
+        indptr, words = wordset.inverted_index(self.S0)
+        strong = np.flatnonzero(self.synapses['strength'] != 1.0)
+        lengths = indptr[strong + 1] - indptr[strong]
+        k = np.bincount(words[_ranges(indptr[strong], lengths)],
+                        minlength=len(wordset))
+        threshold = self.H if self.training else self.H*self.G
+        return kernels.fires(np.diff(wordset.indptr), k, self.G, threshold)
+
+
+    def train_many(self, wordset, backend=None):
+        """Trains the neuron with every word of a WordSet, in order.
+
+        Args:
+            wordset: A WordSet to train the neuron with.
+            backend: Kernel backend to use, see the kernels module. Defaults
+                to Numba if it is installed and NumPy otherwise.
+
+        Returns:
+            An array of Booleans indicating whether the neuron fired or not
+            for each word.
+        """
+        if not self.training:
+            print "[WARN] train(w) was called when not in training mode."
+            return np.zeros(len(wordset), dtype=bool)
+
+        backend = kernels.resolve_backend(backend)
+        if backend == 'numpy':
+            return np.array([self.train(w) for w in wordset.words],
+                            dtype=bool)
+
+        fired = np.zeros(len(wordset), dtype=bool)
+        strength = self._kernel_strength()
+        kernel = kernels.get_kernel('train_extended', backend)
+        kernel(strength, self.synapses['delay'],
+               self.synapses['container'], wordset.synapse_offsets,
+               wordset.synapse_delays, wordset.indptr, self.H, self.G,
+               self.C, (self.D1 + self.D2) * self.C, fired)
+        self.synapses['strength'] = strength
+        return fired
+
+
+    def train_batched(self, wordset, block_size=TRAIN_BLOCK_WORDS):
+        """Trains the neuron with every word of a WordSet, a block of words
+        at a time.
+
+        The words of a block are exposed at once against the current synapse
+        strengths. The outcome of a word only depends on its own synapses, so
+        it is final unless an earlier fired word of the block strengthened
+        one of them. The updates of all the words before the first such
+        conflict are committed together, and the words from the conflict on
+        are exposed again. The result is exactly the one of train_many.
+
+        Args:
+            wordset: A WordSet to train the neuron with.
+            block_size: Maximum number of words exposed at once. The block
+                shrinks when conflicts are frequent.
+
+        Returns:
+            An array of Booleans indicating whether the neuron fired or not
+            for each word.
+        """
+        if not self.training:
+            print "[WARN] train(w) was called when not in training mode."
+            return np.zeros(len(wordset), dtype=bool)
+
+        num_words = len(wordset)
+        num_bins = (self.D1 + self.D2) * self.C
+        strength = self.synapses['strength']
+        G = strength.dtype.type(self.G)
+        fired = np.zeros(num_words, dtype=bool)
+
+        # First word of the block that changes each synapse, block_size if
+        # none does
+        earliest = np.empty(self.S0, dtype=int)
+        earliest.fill(block_size)
+
+        start, size = 0, block_size
+        while start < num_words:
+            stop = min(start + size, num_words)
+            indptr = wordset.indptr[start:stop+1]
+            syn = slice(indptr[0], indptr[-1])
+            offsets = wordset.synapse_offsets[syn]
+            synapses = self.synapses[offsets]
+
+            rows = np.repeat(np.arange(stop - start), np.diff(indptr))
+            bins = (synapses['delay'].astype(int) +
+                    wordset.synapse_delays[syn]) * self.C + \
+                   synapses['container']
+            n, k = _bin_counts(rows, bins, synapses['strength'] != 1.0,
+                               stop - start, num_bins)
+            block_fired, first = _first_fired(n, k, self.H, self.G, True)
+
+            # Find the first word that has a synapse changed by an earlier
+            # one. Rows are sorted, so the first change of each synapse is
+            # the one of the earliest word.
+            changed = block_fired[rows] & (bins == first[rows]) & \
+                      (synapses['strength'] != G)
+            changed_offsets, index = np.unique(offsets[changed],
+                                               return_index=True)
+            earliest[changed_offsets] = rows[changed][index]
+            conflicts = rows[earliest[offsets] < rows]
+            valid = conflicts.min() if len(conflicts) else stop - start
+            earliest[changed_offsets] = block_size
+
+            # Commit the words before it
+            fired[start:start+valid] = block_fired[:valid]
+            strength[offsets[changed & (rows < valid)]] = G
+            start += valid
+            size = min(max(2 * valid, 16), block_size)
+
+        return fired
 
 
     def start_training(self):
@@ -245,3 +880,218 @@ class Neuron(object):
        """
         self.training = False
 
+
+    def _expose(self, w):
+        """Counts the synapses of all the (delay, container) bins of a word
+        with a single bincount pass.
+
+        Returns:
+            A 3-element tuple containing whether the neuron fired, the first
+            fired bin, and the bin of every synapse of the word.
+        """
+        synapses = self.synapses[w.offsets]
+        num_bins = (self.D1 + self.D2) * self.C
+        bins = (synapses['delay'].astype(int) + w.delays) * self.C + \
+               synapses['container']
+        n, k = _bin_counts(np.zeros(len(bins), dtype=int), bins,
+                           synapses['strength'] != 1.0, 1, num_bins)
+        fired, first = _first_fired(n, k, self.H, self.G, self.training)
+        return fired[0], first[0], bins
+
+
+    def _kernel_strength(self):
+        """Returns the synapse strengths in a precision the kernels support.
+
+        Numba has no half precision arithmetic, so the strengths of compact
+        neurons are copied to single precision.
+        """
+        strength = self.synapses['strength']
+        if strength.dtype == np.float16:
+            strength = strength.astype(np.float32)
+        return strength
+
+
+
+class NeuronPopulation(object):
+    """Models a population of independent CE neurons sharing the same
+    parameters.
+
+    The synapse records of all the neurons are stored in stacked 2-D arrays,
+    one row per neuron, so that a word can be presented to the whole
+    population with a few NumPy calls. Each neuron behaves exactly as an
+    independent Neuron instance with the same synapse records.
+
+    Attributes:
+        size: Number of neurons in the population.
+        S0: Number of synapses.
+        H: Number of synapses needed to fire a neuron.
+        G: Ratio of strong synapse strength to weak synapse strength, binary
+            approximation.
+        C: Number of dendrite compartments capable of firing independently.
+        D1: Number of possible time slots where neurons can produce spikes.
+        D2: Number of different time delays available between two neural
+            layers.
+        strength: Array of shape (size, S0) with the synapse strengths.
+        delay: Array of shape (size, S0) with the synapse delays, in
+            range(D2).
+        container: Array of shape (size, S0) with the dendrite compartment of
+            each synapse.
+        training: whether the population is in training mode.
+    """
+
+    def __init__(self, size, S0 = 200, H = 5.0, G = 2.0, C = 1, D1 = 4,
+                       D2 = 7, rng = None):
+        """Inits NeuronPopulation class.
+
+        Args:
+            size: Number of neurons in the population.
+            S0: Number of synapses.
+            H: Number of synapses needed to fire a neuron.
+            G: Ratio of strong synapse strength to weak synapse strength,
+                binary approximation.
+            C: Number of dendrite compartments capable of firing independently.
+            D1: Number of possible time slots where neurons can produce spikes.
+            D2: Number of different time delays available between two neural
+                layers.
+            rng: NumPy RandomState to draw the synapse delays and containers
+                from. Defaults to the global random state.
+        """
+        if rng is None:
+            rng = np.random
+
+        self.size = size
+        self.S0 = S0
+        self.H = H
+        self.G = G
+        self.C = C
+        self.D1 = D1
+        self.D2 = D2
+        self.training = False
+        self.strength = np.ones((size, S0), dtype='float32')
+        self.delay = rng.randint(D2, size=(size, S0)).astype('uint16')
+        self.container = rng.randint(C, size=(size, S0)).astype('uint16')
+
+
+    @classmethod
+    def from_neurons(cls, neurons):
+        """Builds a population from a list of Neuron instances.
+
+        The synapse records are copied, so the neurons are not modified by the
+        population.
+
+        Args:
+            neurons: Non-empty list of Neuron instances sharing the same
+                parameters.
+
+        Returns:
+            A NeuronPopulation instance.
+        """
+        n = neurons[0]
+        for other in neurons[1:]:
+            if (other.S0, other.H, other.G, other.C, other.D1, other.D2) != \
+               (n.S0, n.H, n.G, n.C, n.D1, n.D2):
+                raise ValueError('neurons have to share the same parameters')
+
+        population = cls(0, n.S0, n.H, n.G, n.C, n.D1, n.D2)
+        population.size = len(neurons)
+        population.strength = np.vstack(
+                [m.synapses['strength'] for m in neurons])
+        population.delay = np.vstack([m.synapses['delay'] for m in neurons])
+        population.container = np.vstack(
+                [m.synapses['container'] for m in neurons])
+        population.training = n.training
+        return population
+
+
+    def neuron(self, i):
+        """Returns a Neuron instance with a copy of the i-th synapse records.
+        """
+        n = Neuron(self.S0, self.H, self.G, self.C, self.D1, self.D2)
+        n.synapses['strength'] = self.strength[i]
+        n.synapses['delay'] = self.delay[i]
+        n.synapses['container'] = self.container[i]
+        n.training = self.training
+        return n
+
+
+    def expose(self, words):
+        """Presents a word to every neuron of the population.
+
+        Args:
+            words: A Word to present to all the neurons, or a sequence of
+                `size` Words, one for each neuron.
+
+        Returns:
+            A 3-element tuple of arrays of length size containing:
+                0. Booleans indicating whether each neuron fired or not.
+                1. The delay in which each neuron has fired, -1 if it has not.
+                2. The container where the firing occurred, -1 if it has not.
+        """
+        fired, first, rows, offsets, bins = self._expose(words)
+        delay = np.where(fired, first // self.C, -1)
+        container = np.where(fired, first % self.C, -1)
+        return fired, delay, container
+
+
+    def train(self, words):
+        """Trains every neuron of the population with an input word.
+
+        Args:
+            words: A Word to train all the neurons with, or a sequence of
+                `size` Words, one for each neuron.
+
+        Returns:
+            An array of Booleans indicating whether each neuron fired or not.
+        """
+        if not self.training:
+            print "[WARN] train(w) was called when not in training mode."
+            return np.zeros(self.size, dtype=bool)
+
+        fired, first, rows, offsets, bins = self._expose(words)
+
+        # Update the synapses that contributed to the firing
+        active = fired[rows] & (bins == first[rows])
+        self.strength[rows[active], offsets[active]] = self.G
+
+        return fired
+
+
+    def start_training(self):
+        """Set the population in training mode.
+       """
+        self.training = True
+
+
+    def finish_training(self):
+        """Set the population in recognition mode.
+       """
+        self.training = False
+
+
+    def _expose(self, words):
+        """Counts the synapses of all (delay, container) bins for every
+        neuron with a single bincount pass.
+
+        Returns:
+            A 5-element tuple containing the fired flags and first fired bin
+            of each neuron, and the neuron, synapse offset and bin of every
+            presented synapse.
+        """
+        if isinstance(words, Word):
+            words = [words] * self.size
+        elif len(words) != self.size:
+            raise ValueError('one word per neuron has to be provided')
+
+        rows = np.repeat(np.arange(self.size),
+                         [len(w.offsets) for w in words])
+        offsets = np.concatenate([w.offsets for w in words] + [[]]).astype(int)
+        delays = np.concatenate([w.delays for w in words] + [[]]).astype(int)
+
+        num_bins = (self.D1 + self.D2) * self.C
+        bins = (self.delay[rows, offsets] + delays) * self.C + \
+               self.container[rows, offsets]
+        n, k = _bin_counts(rows, bins, self.strength[rows, offsets] != 1.0,
+                           self.size, num_bins)
+        fired, first = _first_fired(n, k, self.H, self.G, self.training)
+
+        return fired, first, rows, offsets, bins
@@ -19,44 +19,131 @@
 
 from run_experiment import Cognon
 from run_experiment import Configuration
+from run_experiment import Profile
+from run_experiment import Workers
+from result_cache import ResultCache
 
+from multiprocessing import cpu_count
+import hashlib
+import time
 
-def run_table_row(w, active, C, D1, D2, Q, R, G, H):
-    repetitions = 20
 
+REPETITIONS = 20
+CACHE_DIR = '.cognon_cache'
+
+
+def table_config(w, active, C, D1, D2, Q, R, G, H):
     config = Configuration()
     config.neuron_params(C, D1, D2, Q, G, H)
     config.test_params(active, R, w, 5000)
-
-    cognon = Cognon()
-    return cognon.run_configuration(config, repetitions)
-
-
-def table21():
+    return config
+
+
+def row_seed(row):
+    # Every row gets its own fixed seed, so its results can be cached
+    return int(hashlib.sha1(repr(row)).hexdigest()[:16], 16)
+
+
+def run_table(sections, row_config, print_row, workers=None, cache=None,
+              profile=False):
+    """Runs all the rows of a table as a single batch and prints them.
+
+    Args:
+        sections: List of sections of the table, each one a list with the
+            parameters of its rows.
+        row_config: Function returning the Configuration of a row.
+        print_row: Function printing a row, given its results and parameters.
+        workers: Workers instance to run the experiments on.
+        cache: ResultCache instance to reuse the results of previous runs.
+        profile: Whether to print the profile of each row after it, as
+            LaTeX comments.
+    """
+    configs = []
+    for rows in sections:
+        for row in rows:
+            config = row_config(*row)
+            config.seed = row_seed(row)
+            config.profile = profile
+            configs.append(config)
+
+    start = time.time()
+    results = Cognon().run_configurations(configs, REPETITIONS, workers,
+                                          cache)
+    wall = time.time() - start
+
+    r = iter(results)
+    for i, rows in enumerate(sections):
+        if i > 0:
+            print "\t\\midrule"
+        for row in rows:
+            row_results = next(r)
+            print_row(row_results, *row)
+            if profile:
+                print_profile(row_results)
+
+    if profile:
+        processes = workers.processes if workers else cpu_count()
+        print_overhead(results, wall, processes)
+
+
+def print_profile(r):
+    """Prints the mean time of each phase of the repetitions of a row, and
+    the highest memory high-water mark of the processes that ran them, as a
+    LaTeX comment.
+    """
+    total = sum(r[phase + '_wall'].sum() for phase in Profile.PHASES)
+    phases = []
+    for phase in Profile.PHASES:
+        wall = r[phase + '_wall']
+        phases.append('{} {:.3f}s ({:.0%}, cpu {:.3f}s, hwm {:.0f} MB)'.format(
+                phase, wall.mean(), wall.sum() / total if total else 0,
+                r[phase + '_cpu'].mean(), r[phase + '_rss_hwm'].max() / 1024))
+    print "\t% " + ", ".join(phases) + \
+          ", {:.2f} bins/word".format(r['bins_scanned'].mean())
+
+
+def print_overhead(results, wall, processes):
+    """Prints how much of the wall time of a table was spent outside the
+    repetitions, in scheduling and pool overhead, as a LaTeX comment.
+    """
+    busy = sum(r[phase + '_wall'].sum() for r in results
+               for phase in Profile.PHASES)
+    overhead = max(wall - busy / processes, 0.0)
+    print "\t% wall {:.2f}s, repetitions {:.2f}s on {} processes, " \
+          "overhead {:.2f}s".format(wall, busy, processes, overhead)
+
+
+TABLE21 = [
+    # N | H |  S0  |  w  | G #
+    [( 4,  4,    10,   1, 100),
+     ( 5,  4,    10,   1, 100),
+     ( 4,  4,    10,   2, 100),
+     (10, 10,   100,   4, 100),
+     (11, 10,   100,   4, 100),
+     (11, 10,   100,   5, 100),
+     (11, 10,  1000,  60, 100),
+     (11, 10, 10000, 600, 100),
+     (22, 20, 10000, 450, 100)],
+
+    [(10, 10,   100,   6, 1.5),
+     (11, 10,  1000,  15, 1.5),
+     (11, 10, 10000, 160, 1.5),
+     (14, 10, 10000,  10, 1.5)],
+]
+
+def table21(workers=None, cache=None, profile=False):
     print "%%%%%%%%%%%%%%"
     print "% Table 2.1. %"
     print "%%%%%%%%%%%%%%"
     print
-              # N | H |  S0  |  w  | G #
-    table21_row( 4,  4,    10,   1, 100)
-    table21_row( 5,  4,    10,   1, 100)
-    table21_row( 4,  4,    10,   2, 100)
-    table21_row(10, 10,   100,   4, 100)
-    table21_row(11, 10,   100,   4, 100)
-    table21_row(11, 10,   100,   5, 100)
-    table21_row(11, 10,  1000,  60, 100)
-    table21_row(11, 10, 10000, 600, 100)
-    table21_row(22, 20, 10000, 450, 100)
-
-    print "\t\\midrule"
-
-    table21_row(10, 10,   100,   6, 1.5)
-    table21_row(11, 10,  1000,  15, 1.5)
-    table21_row(11, 10, 10000, 160, 1.5)
-    table21_row(14, 10, 10000,  10, 1.5)
-
-def table21_row(N, H, S, w, G):
-    r = run_table_row(w, N, 1, 1, 1, S/float(H), None, G, float(H))
+    run_table(TABLE21, table21_config, table21_row, workers, cache, profile)
+
+def table21_config(N, H, S, w, G):
+    config = table_config(w, N, 1, 1, 1, S/float(H), None, G, float(H))
+    config.analytic = True
+    return config
+
+def table21_row(r, N, H, S, w, G):
     pF_mean = r['pF'].mean()*100
     pF_std  = r['pF'].std()*100
     L_mean  = r['L'].mean()
@@ -65,31 +152,33 @@ def table21_row(N, H, S, w, G):
     print txt.format(pF_mean, N, H, S, w, G, L_mean, L_S0)
 
 
-def table23():
+TABLE23 = [
+    #  H |  G |  S0  |  R  | w #
+    [( 30, 4.0, 10000, 303, 200),
+     (105, 4.0, 10000,  86,  70),
+     ( 40, 1.9, 10000, 250, 100)],
+
+    [(  5, 3.6,  1000, 333, 300),
+     ( 10, 3.6,  1000, 111,  60),
+     (  5, 1.9,  1000, 333, 300),
+     ( 15, 4.0,  1000,  66,  30)],
+
+    [(  5, 3.6,   200,  57,  40),
+     ( 10, 4.0,   200,  20,  10),
+     ( 20, 1.9,   200,  12,  10)],
+]
+
+def table23(workers=None, cache=None, profile=False):
     print "%%%%%%%%%%%%%%"
     print "% Table 2.3. %"
     print "%%%%%%%%%%%%%%"
     print
-              #  H |  G |  S0  |  R  | w #
-    table23_row( 30, 4.0, 10000, 303, 200)
-    table23_row(105, 4.0, 10000,  86,  70)
-    table23_row( 40, 1.9, 10000, 250, 100)
-
-    print "\t\\midrule"
+    run_table(TABLE23, table23_config, table23_row, workers, cache, profile)
 
-    table23_row(  5, 3.6,  1000, 333, 300)
-    table23_row( 10, 3.6,  1000, 111,  60)
-    table23_row(  5, 1.9,  1000, 333, 300)
-    table23_row( 15, 4.0,  1000,  66,  30)
+def table23_config(H, G, S, R, w):
+    return table_config(w, None, 1, 1, 1, S/float(H*R), R, G, float(H))
 
-    print "\t\\midrule"
-
-    table23_row(  5, 3.6,   200,  57,  40)
-    table23_row( 10, 4.0,   200,  20,  10)
-    table23_row( 20, 1.9,   200,  12,  10)
-
-def table23_row(H, G, S, R, w):
-    r = run_table_row(w, None, 1, 1, 1, S/float(H*R), R, G, float(H))
+def table23_row(r, H, G, S, R, w):
     L_mean  = r['L'].mean()
     pF_mean = r['pF'].mean()*100
     pF_std  = r['pF'].std()*100
@@ -101,7 +190,8 @@ def table23_row(H, G, S, R, w):
 
 
 if __name__ == "__main__":
-    #table21()
-    #print
-    table23()
-
+    cache = ResultCache(CACHE_DIR)
+    with Workers() as workers:
+        #table21(workers, cache)
+        #print
+        table23(workers, cache)
@@ -0,0 +1,210 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Compiled kernels for training and exposing neurons with whole WordSets.
+
+Training is sequential, since every trained word may change the synapse
+strengths seen by the next one, so it can not be vectorized with NumPy. The
+kernels below run the whole loop over the CSR arrays of a WordSet, and are
+compiled with Numba when it is installed.
+
+Backends:
+    numpy: The reference NumPy implementation of the neurons, word by word.
+    numba: The kernels compiled with Numba. Only available if Numba is
+        installed.
+    python: The kernels interpreted by Python. Very slow, only useful to check
+        the kernels when Numba is not installed.
+"""
+
+import numpy as np
+import types
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BACKENDS = ('numpy', 'numba', 'python')
+
+# Relative tolerance of the firing thresholds
+TOLERANCE = 1e-9
+
+
+def resolve_backend(backend=None):
+    """Returns the name of the backend to use.
+
+    Args:
+        backend: Name of the requested backend, or None to use Numba if it is
+            installed and NumPy otherwise.
+    """
+    if backend is None:
+        return 'numba' if numba is not None else 'numpy'
+    if backend not in BACKENDS:
+        raise ValueError('unknown backend: %s' % backend)
+    if backend == 'numba' and numba is None:
+        raise ValueError('the numba backend requires Numba to be installed')
+    return backend
+
+
+def get_kernel(name, backend):
+    """Returns the kernel function for the given backend.
+
+    Args:
+        name: Name of the kernel, e.g. 'train_extended'.
+        backend: Either 'numba' or 'python'.
+    """
+    if backend == 'numba':
+        return _compiled[name]
+    return _kernels[name]
+
+
+def fires(n, k, G, threshold):
+    """Returns whether n active synapses, k of them strong, meet a threshold.
+
+    This is the firing rule of every neuron and backend. Synapse strengths
+    are either 1 or G, so the weighted sum is n + (G-1)*k. It is computed
+    from the counts, always in the same order, and compared with a small
+    relative tolerance: a sum that meets the threshold in exact arithmetic
+    fires whatever the binary rounding of G, e.g. a word of H strong
+    synapses for a threshold of H*G. Works elementwise on arrays too.
+    """
+    return n + (G - 1.0) * k >= threshold * (1.0 - TOLERANCE)
+
+
+def _first_bin(strength, delay, container, offsets, delays, start, stop,
+               H, G, C, num_bins, training, counts):
+    """Returns the first (delay, container) bin of a word that meets the
+    threshold, or -1 if the neuron does not fire.
+
+    counts is scratch space of shape (2, num_bins), for the number of active
+    and strong synapses of each bin.
+    """
+    counts[:] = 0
+    for j in range(start, stop):
+        o = offsets[j]
+        b = (np.int64(delay[o]) + delays[j]) * C + container[o]
+        if b < num_bins:
+            counts[0, b] += 1
+            if strength[o] != 1.0:
+                counts[1, b] += 1
+
+    threshold = H if training else H*G
+    for b in range(num_bins):
+        if fires(counts[0, b], counts[1, b], G, threshold):
+            return b
+    return -1
+
+
+def expose_extended(strength, delay, container, offsets, delays, indptr,
+                    H, G, C, num_bins, training, first):
+    """Exposes a CE neuron to every word of a WordSet.
+
+    Stores in first[i] the first bin where the neuron fired for the i-th word,
+    or -1 if it did not fire.
+    """
+    counts = np.zeros((2, num_bins), dtype=np.int64)
+    for i in range(len(indptr) - 1):
+        first[i] = _first_bin(strength, delay, container, offsets, delays,
+                              indptr[i], indptr[i+1], H, G, C, num_bins,
+                              training, counts)
+
+
+def train_extended(strength, delay, container, offsets, delays, indptr,
+                   H, G, C, num_bins, fired):
+    """Trains a CE neuron with every word of a WordSet, in order.
+
+    Stores in fired[i] whether the neuron fired for the i-th word.
+    """
+    counts = np.zeros((2, num_bins), dtype=np.int64)
+    for i in range(len(indptr) - 1):
+        b = _first_bin(strength, delay, container, offsets, delays,
+                       indptr[i], indptr[i+1], H, G, C, num_bins, True,
+                       counts)
+        fired[i] = b >= 0
+        if b < 0:
+            continue
+
+        # Update the synapses that contributed to the firing
+        for j in range(indptr[i], indptr[i+1]):
+            o = offsets[j]
+            if (np.int64(delay[o]) + delays[j]) * C + container[o] == b:
+                strength[o] = G
+
+
+def _count_strong(strength, offsets, start, stop):
+    """Returns the number of strong synapses of a CB word.
+    """
+    k = 0
+    for j in range(start, stop):
+        if strength[offsets[j]] != 1.0:
+            k += 1
+    return k
+
+
+def expose_basic(strength, offsets, indptr, H, G, training, fired):
+    """Exposes a CB neuron to every word of a WordSet.
+
+    Stores in fired[i] whether the neuron fired for the i-th word.
+    """
+    threshold = H if training else H*G
+    for i in range(len(indptr) - 1):
+        k = _count_strong(strength, offsets, indptr[i], indptr[i+1])
+        fired[i] = fires(indptr[i+1] - indptr[i], k, G, threshold)
+
+
+def train_basic(strength, offsets, indptr, H, G, fired):
+    """Trains a CB neuron with every word of a WordSet, in order.
+
+    Stores in fired[i] whether the neuron fired for the i-th word.
+    """
+    for i in range(len(indptr) - 1):
+        k = _count_strong(strength, offsets, indptr[i], indptr[i+1])
+        fired[i] = fires(indptr[i+1] - indptr[i], k, G, H)
+        if fired[i]:
+            for j in range(indptr[i], indptr[i+1]):
+                strength[offsets[j]] = G
+
+
+_kernels = {
+    'expose_extended': expose_extended,
+    'train_extended': train_extended,
+    'expose_basic': expose_basic,
+    'train_basic': train_basic,
+}
+
+
+def _with_globals(func, **names):
+    # Returns a copy of func that sees names instead of the module globals
+    # with the same names
+    return types.FunctionType(func.__code__, dict(func.__globals__, **names),
+                              func.__name__, func.__defaults__,
+                              func.__closure__)
+
+
+# The compiled kernels call compiled copies of the helper functions, the
+# python ones keep calling the plain functions
+_compiled = {}
+if numba is not None:
+    _helpers = {'fires': numba.njit(fires)}
+    for _name, _helper in [('_first_bin', _first_bin),
+                           ('_count_strong', _count_strong)]:
+        _helpers[_name] = numba.njit(_with_globals(_helper, **_helpers))
+    for _name, _kernel in _kernels.items():
+        _compiled[_name] = numba.njit(_with_globals(_kernel, **_helpers))
@@ -0,0 +1,184 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import numpy as np
+
+import cognon_basic
+import cognon_extended
+import kernels
+import run_experiment
+
+
+def model_version(modules=None):
+    """Returns a hash of the source code of the model.
+
+    Args:
+        modules: List of the modules whose source defines the model. Defaults
+            to the neuron modules, the kernels and run_experiment.
+    """
+    if modules is None:
+        modules = [cognon_basic, cognon_extended, kernels, run_experiment]
+
+    h = hashlib.sha1()
+    for module in modules:
+        with open(inspect.getsourcefile(module), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+# Configuration fields that change how a repetition is run, but not its
+# results, so they are left out of the keys
+EXECUTION_FIELDS = ('profile', 'prefilter', 'batched_training')
+
+# Digests of the saved test corpora, by the name, size and modification time
+# of their files, so each corpus is read once per process
+_corpus_digests = {}
+
+
+def corpus_digest(path):
+    """Returns a hash of the contents of a WordSet saved in a directory.
+
+    Args:
+        path: Directory the WordSet was saved to.
+    """
+    names = sorted(os.listdir(path))
+    stats = []
+    for name in names:
+        st = os.stat(os.path.join(path, name))
+        stats.append((name, st.st_size, st.st_mtime))
+    stats = tuple(stats)
+
+    if stats not in _corpus_digests:
+        h = hashlib.sha1()
+        for name in names:
+            h.update(name)
+            with open(os.path.join(path, name), 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), ''):
+                    h.update(block)
+        _corpus_digests[stats] = h.hexdigest()
+    return _corpus_digests[stats]
+
+
+
+class ResultCache(object):
+    """An on-disk store of the results of single experiment repetitions.
+
+    Results are keyed by a hash of the configuration fields, its seed and the
+    repetition index, and stored under a directory named after the model
+    version, so changing the model code invalidates all the entries. A test
+    corpus is keyed by the digest of its contents, not by its path. The
+    fields in EXECUTION_FIELDS are not part of the key, and the Profile
+    fields of the results are not stored: they are NaN in the cached results
+    of a profiled configuration.
+
+    Attributes:
+        path: Root directory of the cache.
+        version: Version of the model code the entries belong to.
+    """
+
+    def __init__(self, path, version=None):
+        """Inits ResultCache class.
+
+        Args:
+            path: Root directory of the cache. Created if it does not exist.
+            version: Version of the model code. Defaults to model_version().
+        """
+        self.path = path
+        self.version = version or model_version()
+
+
+    def key(self, config, repetition):
+        """Returns the key of a repetition of a configuration.
+
+        Configurations without a seed can not be reproduced, so they have no
+        key and are never cached.
+        """
+        if config.seed is None:
+            return None
+        fields = dict((name, value) for name, value in vars(config).items()
+                      if name not in EXECUTION_FIELDS)
+        if config.test_corpus is not None:
+            fields['test_corpus'] = corpus_digest(config.test_corpus)
+        fields = json.dumps(fields, sort_keys=True, default=repr)
+        return hashlib.sha1('%s|%d' % (fields, repetition)).hexdigest()
+
+
+    def get(self, config, repetition):
+        """Returns the cached result of a repetition, or None.
+        """
+        key = self.key(config, repetition)
+        if key is None:
+            return None
+        try:
+            with open(self._filename(key)) as f:
+                return self._result(config, json.load(f)['result'])
+        except IOError:
+            return None
+
+
+    def put(self, config, repetition, result):
+        """Stores the result of a repetition.
+        """
+        key = self.key(config, repetition)
+        if key is None:
+            return
+
+        directory = os.path.join(self.path, self.version)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+        # Write to a temporary file first, so entries are never partial
+        entry = {'config': vars(config), 'repetition': repetition,
+                 'result': [np.asarray(v).tolist()
+                            for v in self._values(config, result)]}
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f, sort_keys=True, default=repr)
+        os.rename(tmp, self._filename(key))
+
+
+    def _values(self, config, result):
+        # Returns the values of a result that are stored, without the Profile
+        # fields
+        names = config.result_names
+        if config.profile:
+            names = names[:-len(run_experiment.Profile.NAMES)]
+        return list(result)[:len(names)]
+
+
+    def _result(self, config, values):
+        # Returns a stored result, with the Profile fields set to NaN
+        if config.profile:
+            values = list(values) + \
+                     [float('nan')] * len(run_experiment.Profile.NAMES)
+        return tuple(values)
+
+
+    def _filename(self, key):
+        return os.path.join(self.path, self.version, key + '.json')
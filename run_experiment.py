@@ -17,53 +17,297 @@
 # limitations under the License.
 #
 
+from cognon_basic import false_positive_rate
 from cognon_extended import Neuron
+from cognon_extended import STREAM_CHUNK_WORDS
 from cognon_extended import WordSet
+from cognon_extended import WordStream
 
+from contextlib import contextmanager
+from itertools import imap
 from math import log
+from math import sqrt
+from multiprocessing import cpu_count
 from multiprocessing import Pool
+import copy
 import numpy as np
+import os
 import random
+import resource
+import tempfile
+import threading
+import time
+
+
+# Directory of the files backing SharedResults, a RAM disk when available
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Repetition index of the test stream of the first test group. The test
+# stream of group g is repetition_rng(seed, TEST_STREAM - g).
+TEST_STREAM = 2**32 - 1
+
+
+def repetition_rng(seed, repetition):
+    """Returns the random stream of a repetition of an experiment.
+
+    The streams of different (seed, repetition) pairs are independent, so the
+    repetitions can run in any order and on any process, and each of them can
+    be reproduced on its own.
+
+    Args:
+        seed: Non-negative integer seed of the whole configuration run.
+        repetition: Index of the repetition.
+
+    Returns:
+        A NumPy RandomState instance.
+    """
+    key = [repetition]
+    while True:
+        key.append(seed & 0xffffffff)
+        seed >>= 32
+        if not seed:
+            break
+    return np.random.RandomState(key)
+
+
+def information(w, pL, pF):
+    """Returns the information L, in bits, stored by a neuron trained with w
+    words, given its recognition and false positive rates.
+
+    L  = w*((1-pL)*log2((1-pL)/(1-pF)) + pL*log2(pL/pF)) bits
+
+    The formula has no finite value when pF is 0. Then a neuron that
+    recognizes all its words is credited w bits, and any other neuron 0
+    bits. Tests that observe no false positive use measured_information()
+    instead.
+    """
+    L = 0
+    if pL == 1.0:
+        if pF != 0:
+            L = -w*log(pF)/log(2.0)
+        else:
+            L = w
+    elif pL > pF > 0:
+        L = w/log(2.0) * \
+            (log(1.0 - pL) - log(1.0 - pF) +
+             pL * (log(1.0 - pF) - log(1.0 - pL) + log(pL) - log(pF)))
+    return L
+
+
+def wilson_interval(k, n, z):
+    """Returns the Wilson score interval of a proportion.
+
+    Args:
+        k: Number of successes.
+        n: Number of trials.
+        z: Quantile of the standard normal distribution, e.g. 1.96 for a 95%
+            confidence interval.
+
+    Returns:
+        A (low, high) tuple.
+    """
+    p = k/float(n)
+    center = (p + z*z/(2.0*n)) / (1.0 + z*z/n)
+    half = z*sqrt(p*(1.0 - p)/n + z*z/(4.0*n*n)) / (1.0 + z*z/n)
+    return max(center - half, 0.0), min(center + half, 1.0)
+
+
+def measured_information(w, pL, false_positives, num_test_words, z):
+    """Returns the information L stored by a neuron trained with w words,
+    given its recognition rate and the outcome of a false positive test.
+
+    When no false positive is observed, pF is only known to be below the
+    upper bound of its Wilson interval, which is used instead. L is then
+    finite, and equal to the low bound of its interval.
+
+    Args:
+        w: Number of training words.
+        pL: Recognition rate.
+        false_positives: Number of test words that fired the neuron.
+        num_test_words: Number of test words.
+        z: Quantile of the standard normal distribution of the interval.
+    """
+    if false_positives == 0:
+        pF = wilson_interval(0, num_test_words, z)[1]
+    else:
+        pF = false_positives/float(num_test_words)
+    return information(w, pL, pF)
 
 
 class Alice(object):
 
-    def train(self, neuron, wordset):
+    def __init__(self, batched=False):
+        self.batched = batched # Use Neuron.train_batched
+
+
+    def train(self, neuron, wordset, checkpoints=None):
+        """Trains the neuron with a WordSet.
+
+        Args:
+            neuron: Neuron to train.
+            wordset: WordSet to train the neuron with.
+            checkpoints: Optional sorted list of word counts. After training
+                with each number of words a copy of the synapse strengths is
+                taken.
+
+        Returns:
+            The list of snapshots of the synapse strengths, one for each
+            checkpoint, if checkpoints are provided.
+        """
         neuron.start_training()
+        train = neuron.train_batched if self.batched else neuron.train_many
 
-        for word in wordset.words:
-            fired = neuron.train(word)
+        if checkpoints is None:
+            train(wordset)
+            neuron.finish_training()
+            return
+
+        snapshots = []
+        start = 0
+        for stop in checkpoints:
+            train(wordset.slice(start, stop))
+            snapshots.append(neuron.synapses['strength'].copy())
+            start = stop
+        train(wordset.slice(start, len(wordset)))
 
         neuron.finish_training()
+        return snapshots
 
 
 
 class Bob(object):
 
-    def __init__(self):
+    def __init__(self, prefilter=False):
+        self.prefilter = prefilter # Skip test words that can not fire
         self.true_true = 0   # trained and fired (ok)
         self.true_false = 0  # trained but not fired (false negative)
         self.false_true = 0  # not trained but fired (false positive)
         self.false_false = 0 # not trained and not fired (ok)
+        self.bins_scanned = 0 # (delay, container) bins checked on test words
 
     def test(self, neuron, train_wordset, test_wordset):
-        # Check the training set
-        for word in train_wordset.words:
-            fired, delay, container = neuron.expose(word)
-            if fired:
-                self.true_true += 1
-            else:
-                self.true_false += 1
-
-        # Check the test set
-        #num_active = len(train_wordset.words[0].synapses[0])
-        #test_wordset = Wordset(num_test_words, neuron.S0, neuron.D1, num_active)
-        for word in test_wordset.words:
-            fired, delay, container = neuron.expose(word)
-            if fired:
-                self.false_true += 1
-            else:
-                self.false_false += 1
+        self.test_trained(neuron, train_wordset)
+
+        # Check the test set, which may be streamed in chunks
+        for chunk in test_wordset.chunks():
+            self.test_untrained(neuron, chunk)
+
+    def test_trained(self, neuron, wordset):
+        fired = neuron.expose_many(wordset)[0]
+        self.true_true += np.count_nonzero(fired)
+        self.true_false += len(fired) - np.count_nonzero(fired)
+
+    def test_untrained(self, neuron, wordset):
+        fired, delay, container = neuron.expose_many(
+                wordset, prefilter=self.prefilter)
+        self.false_true += np.count_nonzero(fired)
+        self.false_false += len(fired) - np.count_nonzero(fired)
+
+        # Bins are checked in d-major, c-minor order until the neuron fires
+        num_bins = (neuron.D1 + neuron.D2) * neuron.C
+        self.bins_scanned += np.where(fired, delay*neuron.C + container + 1,
+                                      num_bins).sum()
+
+
+
+def _reset_peak_rss():
+    # Resets the resident memory high-water mark of the process, which is
+    # only possible on Linux
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def _peak_rss():
+    # Returns the resident memory high-water mark of the process in
+    # kilobytes, since the last reset on Linux and since the start of the
+    # process elsewhere
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Profile(object):
+    """Accumulates the wall time, CPU time and peak memory of the phases of an
+    experiment.
+
+    Attributes:
+        wall: Wall time spent in each phase, in seconds.
+        cpu: User and system CPU time spent in each phase, in seconds.
+        rss_hwm: Resident memory high-water mark of the process during each
+            phase, in kilobytes. On Linux the mark is reset when a phase
+            starts. Elsewhere it is the peak over the whole life of the
+            process, which includes the earlier tasks of a reused worker.
+    """
+
+    PHASES = ('generate', 'train', 'test')
+
+    # Names of the result fields of a profiled experiment
+    NAMES = tuple('%s_%s' % (phase, measure) for phase in PHASES
+                  for measure in ('wall', 'cpu', 'rss_hwm')) + \
+            ('bins_scanned',)
+
+    def __init__(self):
+        self.wall = dict.fromkeys(self.PHASES, 0.0)
+        self.cpu = dict.fromkeys(self.PHASES, 0.0)
+        self.rss_hwm = dict.fromkeys(self.PHASES, 0)
+
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that adds the time spent in its body to a phase,
+        and raises its memory high-water mark to the peak of the body.
+        """
+        _reset_peak_rss()
+        wall, cpu = time.time(), sum(os.times()[:2])
+        try:
+            yield
+        finally:
+            self.wall[name] += time.time() - wall
+            self.cpu[name] += sum(os.times()[:2]) - cpu
+            self.rss_hwm[name] = max(self.rss_hwm[name], _peak_rss())
+
+
+    def iterate(self, name, iterable):
+        """Iterates over iterable, adding the time spent producing each item
+        to a phase.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+    def values(self, bob, shares=1):
+        """Returns the values of the fields in NAMES.
+
+        Args:
+            bob: Bob instance that tested the neuron, to get the mean number
+                of bins checked per test word.
+            shares: Number of repetitions that were profiled together. Their
+                wall and CPU times are split evenly among them.
+        """
+        values = []
+        for phase in self.PHASES:
+            values += [self.wall[phase] / shares, self.cpu[phase] / shares,
+                       self.rss_hwm[phase]]
+        num_words = bob.false_true + bob.false_false
+        if num_words:
+            values.append(bob.bins_scanned / float(num_words))
+        else:
+            values.append(float('nan'))
+        return tuple(values)
 
 
 
@@ -72,6 +316,16 @@ class Configuration(object):
     def __init__(self):
         self.neuron_params()
         self.test_params()
+        self.stopping_params()
+        self.seed = None # Seed of the random streams, None for a fresh one
+        self.checkpoints = None # Word counts to measure a L(w) curve at
+        self.profile = False # Add the Profile fields to the results
+        self.batched_training = False # Train blocks of words at once
+        # Only expose the test words that may fire. Indexing a chunk costs
+        # a few full passes over it, so it is only done when the chunk is
+        # exposed to several neurons (test_group > 1) or snapshots
+        # (checkpoints), and single neurons are tested as usual.
+        self.prefilter = False
 
 
     def neuron_params(self, C = 1, D1 = 4, D2 = 7, Q = 40, G = 2, H = 5):
@@ -83,29 +337,423 @@ class Configuration(object):
         self.Q = Q   # Q = S0/(H*R*C)
 
 
-    def test_params(self, num_active = 4, R = None, w = 100, num_test_words = 0):
+    def test_params(self, num_active = 4, R = None, w = 100, num_test_words = 0,
+                    test_chunk_size = STREAM_CHUNK_WORDS, analytic = False,
+                    test_corpus = None, test_group = 1):
         self.num_active = num_active # Num. of active synapses per word
         self.R = R   # Avg. num. of patterns per afferent synapse spike
         self.w = w   # Num. of words to train the neuron with
         self.num_test_words = num_test_words # Num. of words to test
+        self.test_chunk_size = test_chunk_size # Num. of test words in memory
+        self.analytic = analytic # Compute pF exactly instead of testing
+        self.test_corpus = test_corpus # Saved WordSet to test, None to draw
+        self.test_group = test_group # Num. of repetitions sharing test words
+
+
+    def stopping_params(self, precision = None, max_test_words = None,
+                        batch_size = 1000, z = 1.96):
+        # Sequential testing: test batches of words until the confidence
+        # intervals on pF and L are narrower than precision*pF and precision*L
+        self.precision = precision # Target relative width, None to disable
+        self.max_test_words = max_test_words # Budget, num_test_words if None
+        self.batch_size = batch_size # Num. of test words between checks
+        self.z = z   # Normal quantile of the confidence level
+
+
+    @property
+    def result_names(self):
+        names = ('pL', 'pF', 'L')
+        if self.precision is not None:
+            names += ('num_test_words', 'pF_low', 'pF_high', 'L_low', 'L_high')
+        if self.profile:
+            names += Profile.NAMES
+        return names
+
+
+    @property
+    def result_dtype(self):
+        # With checkpoints every field holds one value per checkpoint
+        if self.checkpoints:
+            return [(name, np.float64, (len(self.checkpoints),))
+                    for name in self.result_names]
+        return [(name, np.float64) for name in self.result_names]
 
 
     @property
     def S0(self):
+        # Rounded, since Q is often set from S0, e.g. Q = S0/(H*R*C), and
+        # the product may fall just below it
         if self.R:
-            return int(self.Q * self.H * self.C * self.R)
+            return int(round(self.Q * self.H * self.C * self.R))
         else:
-            return int(self.Q * self.H * self.C)
+            return int(round(self.Q * self.H * self.C))
+
+
+    @property
+    def cost(self):
+        # Rough estimate of the work of one repetition, for scheduling
+        return self.S0 * self.w * max(self.num_test_words, 1)
+
+
+
+class _ReadyResult(object):
+    # The result of a task run serially by Workers.apply_async
+
+    def __init__(self, func, task):
+        try:
+            self.value, self.ok = func(task), True
+        except Exception as e:
+            self.value, self.ok = e, False
+
+
+    def ready(self):
+        return True
+
+
+    def wait(self, timeout=None):
+        pass
+
+
+    def get(self, timeout=None):
+        if not self.ok:
+            raise self.value
+        return self.value
+
+
+
+class Workers(object):
+    """A pool of worker processes that can be reused by several runs.
+
+    The pool is started on first use and stays warm until it is closed, so a
+    whole table or sweep can share it. It can be used as a context manager:
+
+        with Workers() as workers:
+            cognon.run_configuration(config, repetitions, workers)
+
+    Attributes:
+        processes: Number of worker processes. With a single process the
+            tasks are run serially, without forking.
+        chunksize: Number of tasks sent to a worker at once. If None, it is
+            chosen so that each worker gets about 4 chunks, except for the
+            runs of Cognon, which send one task at a time.
+    """
+
+    def __init__(self, processes=None, chunksize=None):
+        self.processes = processes or cpu_count()
+        self.chunksize = chunksize
+        self.pool = None
+        self.started = frozenset() # Process ids of the workers at start
+        self.lock = threading.Lock() # The pool may be started by any thread
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+    def imap_unordered(self, func, tasks, chunksize=None):
+        """Runs func over every task, yielding the results as they finish.
+
+        Tasks are dispatched in order. chunksize overrides the default
+        number of tasks sent to a worker at once.
+        """
+        tasks = list(tasks)
+        if self.processes == 1:
+            return imap(func, tasks)
+
+        chunksize = chunksize or self.chunksize or \
+                    max(1, len(tasks) // (4 * self.processes))
+        return self._pool().imap_unordered(func, tasks, chunksize)
+
+
+    def apply_async(self, func, task):
+        """Runs func over a single task.
+
+        With a single process the task is run right away. Otherwise it is
+        run by a worker process. If the worker dies while running it, the
+        result never becomes ready, see pids.
+
+        Returns:
+            A multiprocessing AsyncResult-like object, with ready(), wait()
+            and get() methods.
+        """
+        if self.processes == 1:
+            return _ReadyResult(func, task)
+        return self._pool().apply_async(func, (task,))
+
+
+    def pids(self):
+        """Returns the set of process ids of the workers.
+
+        The pool replaces the workers that die, so a change in the set means
+        that the tasks they were running are lost.
+        """
+        with self.lock:
+            if self.pool is None:
+                return frozenset()
+            return frozenset(p.pid for p in self.pool._pool)
+
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = Pool(processes=self.processes)
+                self.started = frozenset(p.pid for p in self.pool._pool)
+            return self.pool
+
+
+    def close(self):
+        """Waits for the pending tasks and stops the worker processes.
+
+        If a worker died, the tasks it was running never finish, so the
+        processes are stopped without waiting.
+        """
+        if self.pool is not None and self.pids() != self.started:
+            self.terminate()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+    def terminate(self):
+        """Stops the worker processes without waiting for pending tasks.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+
+class SharedResults(object):
+    """A structured array of results that worker processes write into.
+
+    The array is backed by a memory-mapped file, so workers store their
+    results in place and only the file name is pickled. Python 2 has no
+    multiprocessing.shared_memory, and a file on a RAM disk plays its role.
+
+    Attributes:
+        path: Name of the file backing the array.
+        dtype: Structured dtype of the results.
+        size: Number of results.
+    """
+
+    def __init__(self, dtype, size, dir=SHARED_DIR):
+        """Inits SharedResults class.
+
+        Args:
+            dtype: Structured dtype of the results.
+            size: Number of results.
+            dir: Directory to create the backing file in.
+        """
+        fd, self.path = tempfile.mkstemp(prefix='cognon-', dir=dir)
+        os.close(fd)
+        self.dtype = np.dtype(dtype)
+        self.size = size
+        self._array = self._map('w+')
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+
+    @property
+    def array(self):
+        """The shared array, mapped on first use in each process.
+        """
+        if self._array is None:
+            self._array = self._map('r+')
+        return self._array
+
+
+    def release(self):
+        """Removes the backing file and returns a view of the results.
+
+        The mapping outlives the file, so the view stays valid.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return self.array.view(np.ndarray)
+
+
+    def _map(self, mode):
+        # Empty files can not be mapped
+        if self.size == 0:
+            return np.zeros(0, self.dtype)
+        return np.memmap(self.path, self.dtype, mode, shape=(self.size,))
 
 
 
 class Cognon(object):
 
-    def __call__(self, config):
-        return self.run_experiment(config)
+    def __call__(self, task):
+        row, config, repetitions = task[:3]
+        values = self.run_repetitions(config, repetitions)
+        if len(task) > 3:
+            # Write the results in place instead of sending them back
+            for i, value in zip(repetitions, values):
+                task[3].array[i] = value
+            values = [None] * len(repetitions)
+        return [(row, i, value) for i, value in zip(repetitions, values)]
+
+
+    def run_configuration(self, config, repetitions, workers=None,
+                          cache=None, shared=False):
+        return self.run_configurations([config], repetitions, workers,
+                                       cache, shared)[0]
 
 
-    def run_configuration(self, config, repetitions):
+    def run_configurations(self, configs, repetitions, workers=None,
+                           cache=None, shared=False):
+        """Runs the repetitions of several configurations as a single batch.
+
+        Every (configuration, repetition) pair is an independent task, and the
+        tasks are dispatched longest first, according to Configuration.cost,
+        so the workers stay busy until the whole batch is done. Repetitions in
+        the same group of Configuration.test_group share their test words, so
+        they run together as a single task.
+
+        Args:
+            configs: List of Configuration instances.
+            repetitions: Number of repetitions of each configuration.
+            workers: Workers instance to run the tasks on. If None, a
+                temporary one is used.
+            cache: ResultCache instance. Repetitions found in the cache are
+                not run again, and new results are stored in it.
+            shared: Whether the workers write their results straight into a
+                SharedResults array of each configuration, instead of
+                pickling them back. Worth it for large result fields.
+
+        Returns:
+            A list with the NumPy structured array of results of each
+            configuration.
+        """
+        buffers = []
+        try:
+            results = self._run_batch(configs, repetitions, workers, cache,
+                                      shared, buffers)
+            if shared:
+                for row, i, value in results:
+                    if value is not None:
+                        buffers[row].array[i] = tuple(value)
+                return [b.release() for b in buffers]
+        finally:
+            # Remove the backing files even if the run failed
+            for b in buffers:
+                b.release()
+
+        # Store the results of each configuration in a NumPy structured array
+        values = [[] for config in configs]
+        for row, i, value in sorted(results):
+            values[row].append(tuple(value))
+
+        r = []
+        for config, v in zip(configs, values):
+            r.append(np.array(v, dtype = config.result_dtype))
+        return r
+
+
+    def _run_batch(self, configs, repetitions, workers, cache, shared,
+                   buffers):
+        # Returns the (row, repetition, result) tuples of a batch, appending
+        # the SharedResults of each configuration to buffers if shared
+        tasks = []
+        results = []
+        prepared = []
+        for row, config in enumerate(configs):
+            config, N = self.prepare(config, repetitions)
+            prepared.append(config)
+            if shared:
+                buffers.append(SharedResults(config.result_dtype, N))
+            t, r = self.tasks(row, config, N, cache,
+                              buffers[row] if shared else None)
+            tasks.extend(t)
+            results.extend(r)
+        tasks.sort(key=lambda task: task[1].cost * len(task[2]), reverse=True)
+
+        # Run all the experiments, on a temporary pool if none is provided
+        if workers is None:
+            with Workers() as workers:
+                results.extend(self._run_tasks(tasks, prepared, workers,
+                                               cache, buffers))
+        else:
+            results.extend(self._run_tasks(tasks, prepared, workers, cache,
+                                           buffers))
+        return results
+
+
+    def tasks(self, row, config, N, cache=None, buffer=None):
+        """Returns the tasks to run the repetitions of a prepared
+        configuration.
+
+        The repetitions in the same test group make up a single task. A task
+        is a (row, config, repetitions) tuple, followed by the SharedResults
+        to write the results into, if any, and is run by calling a Cognon
+        instance, which returns a list of (row, repetition, result) tuples.
+
+        Args:
+            row: Index of the configuration in its batch.
+            config: Configuration, as returned by prepare.
+            N: Number of repetitions.
+            cache: ResultCache instance. Repetitions found in the cache are
+                not run again.
+            buffer: SharedResults instance of the configuration, or None.
+
+        Returns:
+            A tuple with the list of tasks and the list of (row, repetition,
+            result) tuples found in the cache.
+        """
+        tasks = []
+        results = []
+        groups = {}
+        for i in xrange(N):
+            value = cache.get(config, i) if cache is not None else None
+            if value is None:
+                groups.setdefault(i // config.test_group, []).append(i)
+            else:
+                results.append((row, i, value))
+        for g, group in sorted(groups.items()):
+            if buffer is not None:
+                tasks.append((row, config, group, buffer))
+            else:
+                tasks.append((row, config, group))
+        return tasks, results
+
+
+    def _run_tasks(self, tasks, configs, workers, cache, buffers):
+        # The tasks are sorted by cost, so unless the workers set their own
+        # chunksize they are sent one at a time to balance the load
+        for results in workers.imap_unordered(Cognon(), tasks,
+                                              workers.chunksize or 1):
+            for row, i, value in results:
+                if cache is not None:
+                    cache.put(configs[row], i,
+                              buffers[row].array[i] if value is None
+                              else value)
+                yield row, i, value
+
+
+    def prepare(self, config, repetitions):
+        """Completes a configuration before running it.
+
+        Sets the number of test words and the seed of a copy of the
+        configuration if they are not set, so that the caller's
+        configuration draws a fresh seed on every run.
+
+        Returns:
+            A 2-element tuple containing the completed configuration and the
+            number of repetitions to run.
+        """
+        config = copy.copy(config)
 
         # Ensure that at least 10,000 words are learnt
         MIN_LEARN_WORDS = 10000
@@ -120,52 +768,310 @@ class Cognon(object):
         if not config.num_test_words:
             config.num_test_words = MIN_TEST_WORDS/N
 
-        # Run all the experiments
-        #values = [self.run_experiment(config) for i in xrange(N)]
-        pool = Pool(processes=20)
-        values = pool.map(Cognon(), [config,]*N)
+        # Draw a fresh seed if none is provided, so the run can be repeated
+        if config.seed is None:
+            config.seed = random.SystemRandom().getrandbits(64)
 
-        # Store the results in a NumPy structured array
-        names = ('pL', 'pF', 'L')
-        types = [np.float64,] * len(values)
-        r = np.array(values, dtype = zip(names, types))
+        return config, N
 
-        return r
 
+    def run_repetition(self, config, repetition):
+        """Runs a single repetition of a configuration run.
 
-    def run_experiment(self, cfg):
+        The repetition draws from its own random stream, derived from
+        config.seed, so it gives the same result as in run_configuration.
+        """
+        return self.run_repetitions(config, [repetition])[0]
 
-        # create a neuron instance with the provided parameters
-        neuron = Neuron(cfg.S0, cfg.H, cfg.G, cfg.C, cfg.D1, cfg.D2)
 
-        # create the training and test wordsets
-        train_wordset = WordSet(cfg.w, cfg.S0, cfg.D1, cfg.num_active, cfg.R)
-        test_wordset = WordSet(cfg.num_test_words, cfg.S0, cfg.D1,
-                               cfg.num_active, cfg.R)
+    def run_repetitions(self, config, repetitions):
+        """Runs several repetitions of a configuration run.
 
-        # create Alice instance to train the neuron
-        alice = Alice()
-        alice.train(neuron, train_wordset)
+        With a test_group larger than one, the repetitions of the same group
+        are tested with the words drawn from the test stream of the group,
+        and each of them gives the same result as when run on its own.
 
-        # create a Bob instance to test the neuron
-        bob = Bob()
-        bob.test(neuron, train_wordset, test_wordset)
+        Returns:
+            A list with the result tuple of each repetition.
+        """
+        if config.test_group == 1:
+            return [self.run_experiment(config,
+                                        repetition_rng(config.seed, i))
+                    for i in repetitions]
 
-        # results
-        pL = bob.true_true/float(cfg.w)
-        pF = bob.false_true/float(cfg.num_test_words)
+        values = []
+        for g in sorted(set(i // config.test_group for i in repetitions)):
+            group = [i for i in repetitions if i // config.test_group == g]
+            values += self.run_group(
+                    config, [repetition_rng(config.seed, i) for i in group],
+                    repetition_rng(config.seed, TEST_STREAM - g))
+        order = sorted(repetitions, key=lambda i: i // config.test_group)
+        result = dict(zip(order, values))
+        return [result[i] for i in repetitions]
 
-        # L  = w*((1-pL)*log2((1-pL)/(1-pF)) + pL*log2(pL/pF)) bits
-        L = 0
-        if pL == 1.0:
-            if pF != 0:
-                L = -cfg.w*log(pF)/log(2.0)
+
+    def run_experiment(self, cfg, rng=None):
+        self._check(cfg)
+        profile = Profile()
+
+        neuron, train_wordset = self._generate(cfg, rng, profile)
+        test_chunks = self._test_chunks(cfg, rng, profile)
+
+        if cfg.checkpoints:
+            return self.run_curve(cfg, neuron, train_wordset, test_chunks,
+                                  profile)
+        return self._test(cfg, [(neuron, train_wordset)], test_chunks,
+                          profile)[0]
+
+
+    def run_group(self, cfg, rngs, test_rng=None):
+        """Runs several repetitions that share the same test words.
+
+        A neuron is created and trained for each repetition, and then every
+        chunk of test words is drawn once and exposed to all the neurons, so
+        the cost of generating the test words is paid once per group.
+
+        Args:
+            cfg: Configuration to run. Its checkpoints are not supported.
+            rngs: List with the NumPy RandomState of each repetition, to draw
+                its neuron and training words from.
+            test_rng: NumPy RandomState to draw the test words from.
+
+        Returns:
+            A list with the result tuple of each repetition. The times of
+            the Profile fields, if any, are those of the whole group split
+            evenly among its repetitions.
+        """
+        self._check(cfg)
+        if cfg.checkpoints:
+            raise ValueError('checkpoints do not support test groups')
+        profile = Profile()
+
+        trained = [self._generate(cfg, rng, profile) for rng in rngs]
+        test_chunks = self._test_chunks(cfg, test_rng, profile)
+        return self._test(cfg, trained, test_chunks, profile)
+
+
+    def _check(self, cfg):
+        if cfg.analytic and (cfg.C, cfg.D1, cfg.D2) != (1, 1, 1):
+            raise ValueError('analytic pF requires C = D1 = D2 = 1')
+        if cfg.analytic and cfg.num_active is None:
+            raise ValueError('analytic pF requires a fixed num_active')
+
+
+    def _generate(self, cfg, rng, profile):
+        """Returns a new neuron and the WordSet to train it with.
+        """
+        with profile.phase('generate'):
+            # create a neuron instance with the provided parameters
+            neuron = Neuron(cfg.S0, cfg.H, cfg.G, cfg.C, cfg.D1, cfg.D2, rng)
+
+            # create the training wordset
+            train_wordset = WordSet(cfg.w, cfg.S0, cfg.D1, cfg.num_active,
+                                    cfg.R, rng)
+        return neuron, train_wordset
+
+
+    def _test_chunks(self, cfg, rng, profile):
+        """Returns an iterator over the chunks of test words.
+
+        The words are drawn lazily, as the chunks are consumed.
+        """
+        if cfg.precision is None:
+            num_test_words = cfg.num_test_words
+            chunk_size = cfg.test_chunk_size
+        else:
+            num_test_words = cfg.max_test_words or cfg.num_test_words
+            chunk_size = cfg.batch_size
+
+        if cfg.test_corpus is None:
+            test_chunks = WordStream(num_test_words, cfg.S0, cfg.D1,
+                                     cfg.num_active, cfg.R, rng,
+                                     chunk_size).chunks()
+        else:
+            # The corpus is mapped read-only, and shared by all the
+            # repetitions and worker processes
+            test_wordset = WordSet.open(cfg.test_corpus)
+            if (test_wordset.word_length, test_wordset.num_delays) != \
+               (cfg.S0, cfg.D1):
+                raise ValueError(
+                        'test corpus %s has word_length %s and num_delays %s,'
+                        ' the configuration needs %d and %d' %
+                        (cfg.test_corpus, test_wordset.word_length,
+                         test_wordset.num_delays, cfg.S0, cfg.D1))
+            test_chunks = test_wordset.slice(0, num_test_words).chunks(
+                    chunk_size)
+        return profile.iterate('generate', test_chunks)
+
+
+    def _test(self, cfg, trained, test_chunks, profile):
+        """Trains and tests a list of neurons with the same test words.
+
+        Args:
+            cfg: Configuration being run.
+            trained: List of (neuron, train_wordset) tuples.
+            test_chunks: Iterator over the chunks of test words.
+            profile: Profile of the run.
+
+        Returns:
+            A list with the result tuple of each neuron.
+        """
+        alice = Alice(cfg.batched_training)
+        prefilter = cfg.prefilter and len(trained) > 1
+        neurons = []
+        bobs = []
+        pLs = []
+        for neuron, train_wordset in trained:
+            with profile.phase('train'):
+                alice.train(neuron, train_wordset)
+
+            # create a Bob instance to test the neuron
+            bob = Bob(prefilter)
+            with profile.phase('test'):
+                bob.test_trained(neuron, train_wordset)
+            neurons.append(neuron)
+            bobs.append(bob)
+            pLs.append(bob.true_true/float(cfg.w))
+        del trained[:] # The training words are not needed anymore
+
+        if not cfg.analytic:
+            # Neurons stop being tested once their intervals are narrow enough
+            active = range(len(neurons))
+            for chunk in test_chunks:
+                with profile.phase('test'):
+                    for k in active:
+                        bobs[k].test_untrained(neurons[k], chunk)
+                if cfg.precision is not None:
+                    active = [k for k in active if
+                              self.interval(cfg, pLs[k], bobs[k])[0] >
+                              cfg.precision]
+                    if not active:
+                        break
+
+        return [self._result(cfg, neuron, pL, bob, profile, len(neurons))
+                for neuron, pL, bob in zip(neurons, pLs, bobs)]
+
+
+    def _result(self, cfg, neuron, pL, bob, profile, shares):
+        # With a single delay and container the neuron is a CB neuron, whose
+        # false positive rate has a closed form
+        if cfg.analytic:
+            num_strong = np.count_nonzero(neuron.synapses['strength'] != 1.0)
+            pF = false_positive_rate(cfg.S0, cfg.H, cfg.G, cfg.num_active,
+                                     num_strong)
+            L = information(cfg.w, pL, pF)
+            if cfg.precision is None:
+                result = (pL, pF, L)
+            else:
+                result = (pL, pF, L, 0, pF, pF, L, L)
+        else:
+            # results
+            num_test_words = bob.false_true + bob.false_false
+            pF = bob.false_true/float(num_test_words)
+            L = measured_information(cfg.w, pL, bob.false_true,
+                                     num_test_words, cfg.z)
+
+            if cfg.precision is None:
+                result = (pL, pF, L)
+            else:
+                result = (pL, pF, L, num_test_words) + \
+                         self.interval(cfg, pL, bob)[1:]
+
+        if cfg.profile:
+            result += profile.values(bob, shares)
+        return result
+
+
+    def run_curve(self, cfg, neuron, train_wordset, test_chunks,
+                  profile=None):
+        """Measures pL, pF and L after training with each checkpoint word
+        count of the configuration.
+
+        The neuron is trained once, and every snapshot of its synapse
+        strengths is tested against the same chunks of test words.
+
+        Returns:
+            A tuple with the arrays of pL, pF and L values, one per
+            checkpoint, followed by the arrays of the Profile fields if
+            cfg.profile is set. The times are those of the whole curve.
+        """
+        if profile is None:
+            profile = Profile()
+        if cfg.precision is not None:
+            raise ValueError('checkpoints do not support early stopping')
+        checkpoints = sorted(cfg.checkpoints)
+        if checkpoints[0] < 1 or checkpoints[-1] > cfg.w:
+            raise ValueError('checkpoints have to be in range(1, w + 1)')
+
+        alice = Alice(cfg.batched_training)
+        with profile.phase('train'):
+            snapshots = alice.train(neuron, train_wordset, checkpoints)
+        strength = neuron.synapses['strength'].copy()
+
+        prefilter = cfg.prefilter and len(checkpoints) > 1
+        bobs = [Bob(prefilter) for w in checkpoints]
+        with profile.phase('test'):
+            for w, snapshot, bob in zip(checkpoints, snapshots, bobs):
+                neuron.synapses['strength'] = snapshot
+                bob.test_trained(neuron, train_wordset.slice(0, w))
+
+        if not cfg.analytic:
+            for chunk in test_chunks:
+                with profile.phase('test'):
+                    for snapshot, bob in zip(snapshots, bobs):
+                        neuron.synapses['strength'] = snapshot
+                        bob.test_untrained(neuron, chunk)
+        neuron.synapses['strength'] = strength
+
+        pL = np.empty(len(checkpoints))
+        pF = np.empty(len(checkpoints))
+        L = np.empty(len(checkpoints))
+        for i, (w, snapshot, bob) in enumerate(zip(checkpoints, snapshots,
+                                                   bobs)):
+            pL[i] = bob.true_true/float(w)
+            if cfg.analytic:
+                pF[i] = false_positive_rate(cfg.S0, cfg.H, cfg.G,
+                                            cfg.num_active,
+                                            np.count_nonzero(snapshot != 1.0))
+                L[i] = information(w, pL[i], pF[i])
             else:
-                L = cfg.w
-        elif pL > pF:
-            L = cfg.w/log(2.0) * \
-                (log(1.0 - pL) - log(1.0 - pF) +
-                 pL * (log(1.0 - pF) - log(1.0 - pL) + log(pL) - log(pF)))
+                n = bob.false_true + bob.false_false
+                pF[i] = bob.false_true/float(n)
+                L[i] = measured_information(w, pL[i], bob.false_true, n,
+                                            cfg.z)
 
+        if cfg.profile:
+            return (pL, pF, L) + tuple(
+                    np.array(v) for v in zip(*[profile.values(bob)
+                                               for bob in bobs]))
         return pL, pF, L
 
+
+    def interval(self, cfg, pL, bob):
+        """Computes the confidence intervals on pF and L of a test run.
+
+        pL is measured on the whole training set, so the interval on L only
+        accounts for the uncertainty on pF.
+
+        Returns:
+            A 5-element tuple containing the largest of the relative widths of
+            both intervals, and their low and high bounds.
+        """
+        n = bob.false_true + bob.false_false
+        pF = bob.false_true/float(n)
+        pF_low, pF_high = wilson_interval(bob.false_true, n, cfg.z)
+
+        L = measured_information(cfg.w, pL, bob.false_true, n, cfg.z)
+        L_low = information(cfg.w, pL, pF_high)
+        if pF_low > 0:
+            L_high = information(cfg.w, pL, pF_low)
+        else:
+            L_high = float('inf')
+
+        # The width on L is relative to at least one bit, since L is often 0
+        if pF > 0:
+            width = (pF_high - pF_low)/pF
+        else:
+            width = float('inf')
+        width = max(width, (L_high - L_low)/max(L, 1.0))
+        return width, pF_low, pF_high, L_low, L_high
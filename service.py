@@ -0,0 +1,511 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Experiment service with a job queue and streamed results.
+
+Jobs are the repetitions of a Configuration. They are queued, run on a
+shared Workers pool, at most a few at a time, and the result of every
+repetition is published as soon as it finishes. Jobs can be cancelled while
+queued or running. The service is used in-process through Service, or
+through a local socket, with one JSON message per line. Run from the root of
+the repository with:
+
+    python service.py /tmp/cognon.sock
+
+and talk to it with Client:
+
+    client = Client('/tmp/cognon.sock')
+    job = client.submit({'H': 5, 'w': 100, 'num_test_words': 10000}, 20)
+    for repetition, (pL, pF, L) in client.watch(job):
+        ...
+"""
+
+from run_experiment import Cognon
+from run_experiment import Configuration
+from run_experiment import Workers
+
+from contextlib import closing
+import Queue
+import SocketServer
+import argparse
+import itertools
+import json
+import numpy as np
+import socket
+import sys
+import threading
+import time
+import traceback
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+# Seconds between the checks of the running tasks
+POLL = 0.1
+
+
+def _run_task(task):
+    # Exceptions are returned as tracebacks, since the ones raised in the
+    # workers lose theirs
+    try:
+        return True, Cognon()(task)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def make_config(fields):
+    """Returns a Configuration with the given fields set.
+
+    Args:
+        fields: Dict of Configuration fields.
+    """
+    config = Configuration()
+    for name, value in sorted(fields.items()):
+        if not hasattr(config, name) or \
+           isinstance(getattr(Configuration, name, None), property):
+            raise ValueError('unknown Configuration field: %s' % name)
+        setattr(config, name, value)
+    return config
+
+
+
+class Job(object):
+    """The repetitions of a configuration, run by a Service.
+
+    Attributes:
+        id: Number of the job in its service.
+        config: Configuration of the job, with its seed set.
+        repetitions: Number of repetitions to run.
+        state: One of QUEUED, RUNNING, DONE, CANCELLED or FAILED.
+        results: List of (repetition, result) tuples, in the order they
+            finished.
+        error: Traceback of the exception that made the job fail, or None.
+    """
+
+    def __init__(self, id, config, repetitions):
+        self.id = id
+        self.config = config
+        self.repetitions = repetitions
+        self.state = QUEUED
+        self.results = []
+        self.error = None
+        self.condition = threading.Condition()
+
+
+    @property
+    def finished(self):
+        return self.state in (DONE, CANCELLED, FAILED)
+
+
+    def cancel(self):
+        """Cancels the job, unless it is already finished.
+
+        The repetitions that are already running finish in the background,
+        but their results are dropped.
+        """
+        self._set_state(CANCELLED)
+
+
+    def wait(self, timeout=None):
+        """Waits until the job is finished.
+
+        Returns:
+            Whether the job is finished.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while not self.finished:
+                # Wake up now and then, so that Ctrl-C gets through
+                remaining = 1.0
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.time())
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.finished
+
+
+    def stream(self):
+        """Yields the (repetition, result) tuples of the job as they finish,
+        until the job is finished.
+        """
+        i = 0
+        while True:
+            with self.condition:
+                while i == len(self.results) and not self.finished:
+                    # Wake up now and then, so that Ctrl-C gets through
+                    self.condition.wait(1.0)
+                results = self.results[i:]
+                finished = self.finished
+            for result in results:
+                yield result
+            i += len(results)
+            if finished:
+                return
+
+
+    def _add_results(self, results):
+        with self.condition:
+            if self.state == RUNNING:
+                self.results.extend(results)
+                self.condition.notify_all()
+
+
+    def _set_state(self, state, error=None):
+        # Returns whether the state changed, finished jobs never change
+        with self.condition:
+            if self.finished:
+                return False
+            self.state = state
+            self.error = error
+            self.condition.notify_all()
+            return True
+
+
+
+class Service(object):
+    """Runs the queued jobs on a Workers pool.
+
+    Jobs start in the order they were submitted. To keep cancellation quick
+    and share the pool among the running jobs, each job has at most one task
+    per worker process in flight. Finished jobs keep their results until
+    they are removed.
+
+    Attributes:
+        workers: Workers instance the jobs are run on.
+        max_jobs: Maximum number of jobs running at the same time.
+        cache: ResultCache instance, or None.
+    """
+
+    def __init__(self, workers, max_jobs=1, cache=None):
+        """Inits Service class and starts its job runner threads.
+        """
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.cache = cache
+        self.jobs = {}
+        self.queue = Queue.Queue()
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+        self.runners = []
+        for i in xrange(max_jobs):
+            runner = threading.Thread(target=self._runner)
+            runner.daemon = True
+            runner.start()
+            self.runners.append(runner)
+
+
+    def submit(self, config, repetitions):
+        """Queues the repetitions of a configuration.
+
+        If the configuration has no seed, one is drawn now and kept in the
+        config of the job, so the job can be repeated. The given
+        configuration is not modified.
+
+        Returns:
+            The new Job.
+        """
+        config, N = Cognon().prepare(config, repetitions)
+        with self.lock:
+            job = Job(next(self.ids), config, N)
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+
+    def cancel(self, id):
+        """Cancels the job with the given id.
+
+        Raises:
+            KeyError: There is no job with that id.
+        """
+        job = self.jobs[id]
+        job.cancel()
+        return job
+
+
+    def remove(self, id):
+        """Drops a finished job with the given id, and its results.
+
+        Raises:
+            KeyError: There is no job with that id.
+            ValueError: The job is not finished.
+        """
+        with self.lock:
+            job = self.jobs[id]
+            if not job.finished:
+                raise ValueError('job %d is not finished' % id)
+            del self.jobs[id]
+        return job
+
+
+    def close(self):
+        """Cancels all the jobs and stops the runner threads.
+        """
+        for job in self.jobs.values():
+            job.cancel()
+        for runner in self.runners:
+            self.queue.put(None)
+        for runner in self.runners:
+            runner.join()
+
+
+    def _runner(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            if job._set_state(RUNNING):
+                self._run(job)
+
+
+    def _run(self, job):
+        tasks, results = Cognon().tasks(0, job.config, job.repetitions,
+                                        self.cache)
+        job._add_results([(i, tuple(value)) for row, i, value in results])
+
+        pending = []
+        pids = None
+        try:
+            for task in tasks:
+                while len(pending) >= self.workers.processes and \
+                      not job.finished:
+                    self._collect(job, pending, pids)
+                if job.finished:
+                    return
+                pending.append(self.workers.apply_async(_run_task, task))
+                if pids is None:
+                    pids = self.workers.pids()
+            while pending and not job.finished:
+                self._collect(job, pending, pids)
+        except Exception:
+            job._set_state(FAILED, traceback.format_exc())
+        job._set_state(DONE)
+
+
+    def _collect(self, job, pending, pids):
+        # Waits until a pending task is ready, the job is cancelled or a
+        # worker died, polling so that none of them goes unnoticed
+        while not job.finished:
+            for result in pending:
+                if result.ready():
+                    pending.remove(result)
+                    self._add(job, result.get())
+                    return
+            if not pids <= self.workers.pids():
+                raise RuntimeError('a worker process died while running '
+                                   'the job')
+            pending[0].wait(POLL)
+
+
+    def _add(self, job, message):
+        ok, value = message
+        if not ok:
+            raise RuntimeError(value)
+        results = []
+        for row, i, result in value:
+            if self.cache is not None:
+                self.cache.put(job.config, i, result)
+            results.append((i, tuple(result)))
+        job._add_results(results)
+
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """Serves the requests of a connection to a Server.
+
+    Every request is a JSON object with an 'op' field, and is answered with
+    one JSON object per line:
+
+        submit: Queues a job with the Configuration fields in 'config' and
+            the number of 'repetitions'. Answers {"job": id}.
+        watch: Answers a {"repetition": i, "result": [...]} line for every
+            result of 'job', as they finish, followed by {"state": state,
+            "traceback": error}.
+        cancel: Cancels 'job'. Answers {"state": state}.
+        remove: Drops 'job' once it is finished. Answers {"state": state}.
+        jobs: Answers {"jobs": [...]} with the id, state and number of
+            results of every job.
+
+    Invalid requests are answered with {"error": message}.
+    """
+
+    def handle(self):
+        service = self.server.service
+        for line in iter(self.rfile.readline, ''):
+            try:
+                request = json.loads(line)
+                op = request['op']
+                if op == 'submit':
+                    config = make_config(request['config'])
+                    job = service.submit(config, request['repetitions'])
+                    self._send({'job': job.id})
+                elif op == 'watch':
+                    job = service.jobs[request['job']]
+                    for i, result in job.stream():
+                        self._send({'repetition': i, 'result':
+                                    [np.asarray(v).tolist() for v in result]})
+                    self._send({'state': job.state, 'traceback': job.error})
+                elif op == 'cancel':
+                    self._send({'state': service.cancel(request['job']).state})
+                elif op == 'remove':
+                    self._send({'state': service.remove(request['job']).state})
+                elif op == 'jobs':
+                    self._send({'jobs': [
+                            {'job': job.id, 'state': job.state,
+                             'results': len(job.results),
+                             'repetitions': job.repetitions}
+                            for id, job in sorted(service.jobs.items())]})
+                else:
+                    raise ValueError('unknown op: %s' % op)
+            except (KeyError, TypeError, ValueError) as e:
+                self._send({'error': '%s: %s' % (type(e).__name__, e)})
+
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message) + '\n')
+        self.wfile.flush()
+
+
+
+class Server(SocketServer.ThreadingUnixStreamServer):
+    """Serves a Service on a Unix socket, one thread per connection.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        SocketServer.ThreadingUnixStreamServer.__init__(self, path, _Handler)
+        self.service = service
+
+
+
+class Client(object):
+    """Connects to a Server.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+    def submit(self, fields, repetitions):
+        """Queues the repetitions of a configuration.
+
+        Args:
+            fields: Dict of Configuration fields.
+            repetitions: Number of repetitions.
+
+        Returns:
+            The id of the job.
+        """
+        return self._request({'op': 'submit', 'config': fields,
+                              'repetitions': repetitions})['job']
+
+
+    def watch(self, job):
+        """Yields the (repetition, result) tuples of a job as they finish.
+
+        Raises:
+            RuntimeError: The job failed.
+        """
+        with closing(self._connect()) as f:
+            self._write(f, {'op': 'watch', 'job': job})
+            for line in iter(f.readline, ''):
+                message = self._check(json.loads(line))
+                if 'state' in message:
+                    if message['state'] == FAILED:
+                        raise RuntimeError(message['traceback'])
+                    return
+                yield message['repetition'], tuple(message['result'])
+
+
+    def cancel(self, job):
+        """Cancels a job and returns its state.
+        """
+        return self._request({'op': 'cancel', 'job': job})['state']
+
+
+    def remove(self, job):
+        """Drops a finished job and its results from the server, and returns
+        its state.
+        """
+        return self._request({'op': 'remove', 'job': job})['state']
+
+
+    def jobs(self):
+        """Returns the list of jobs of the server, as dicts.
+        """
+        return self._request({'op': 'jobs'})['jobs']
+
+
+    def _request(self, request):
+        with closing(self._connect()) as f:
+            self._write(f, request)
+            return self._check(json.loads(f.readline()))
+
+
+    def _connect(self):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.path)
+        f = s.makefile('r+')
+        s.close() # The file keeps the connection open
+        return f
+
+
+    def _write(self, f, message):
+        f.write(json.dumps(message) + '\n')
+        f.flush()
+
+
+    def _check(self, message):
+        if 'error' in message:
+            raise ValueError(message['error'])
+        return message
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path', help='path of the Unix socket')
+    parser.add_argument('-j', dest='max_jobs', type=int, default=1,
+                        help='jobs running at the same time (default: 1)')
+    parser.add_argument('-p', dest='processes', type=int,
+                        help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    with Workers(args.processes) as workers:
+        service = Service(workers, args.max_jobs)
+        server = Server(args.path, service)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
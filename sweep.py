@@ -0,0 +1,347 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Parameter sweeps over experiment configurations.
+
+A point of a sweep is a dict of Configuration fields, e.g. {'H': 5, 'G': 2.0,
+'S0': 1000, 'R': 50, 'w': 100}. S0 is set through Q = S0/(H*R*C). Points can
+be enumerated on a grid or drawn at random, and the number of training words
+w that maximizes the mean L of each point can be searched for. Run from the
+root of the repository to search the best w of the rows of Table 2.3:
+
+    python sweep.py --low 5 --high 500
+"""
+
+from create_tables import REPETITIONS
+from create_tables import TABLE23
+from create_tables import row_seed
+from result_cache import ResultCache
+from run_experiment import Cognon
+from run_experiment import Configuration
+from run_experiment import Workers
+
+from collections import namedtuple
+from math import sqrt
+import argparse
+import copy
+import itertools
+import numpy as np
+import sys
+
+
+# Inverse of the golden ratio
+PHI = (sqrt(5.0) - 1.0) / 2.0
+
+
+def grid(**axes):
+    """Yields every combination of the values of the axes.
+
+    Args:
+        axes: Sequence of values of each Configuration field.
+
+    Yields:
+        Points, as dicts of field values.
+    """
+    names = sorted(axes)
+    for values in itertools.product(*[axes[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+def random_points(n, rng=None, **axes):
+    """Yields points drawn at random.
+
+    Args:
+        n: Number of points to draw.
+        rng: NumPy RandomState to draw the points from. Defaults to the
+            global NumPy random state.
+        axes: Either a sequence of values of each Configuration field, drawn
+            uniformly, or a function that draws a value given rng.
+
+    Yields:
+        Points, as dicts of field values.
+    """
+    if rng is None:
+        rng = np.random
+    names = sorted(axes)
+    for i in xrange(n):
+        point = {}
+        for name in names:
+            if callable(axes[name]):
+                point[name] = axes[name](rng)
+            else:
+                point[name] = axes[name][rng.randint(len(axes[name]))]
+        yield point
+
+
+def golden_section(low, high, values):
+    """Searches the integer in [low, high] that maximizes a unimodal function.
+
+    The search is a generator: it yields the lists of integers whose values
+    it needs next, and reads them from values once the caller has filled it
+    in. When the bracket is down to a handful of integers all of them are
+    yielded, so the maximum is the best of the values.
+
+    Args:
+        low: Lower bound of the search.
+        high: Upper bound of the search.
+        values: Dict from integers to their values, filled in by the caller.
+    """
+    a, b = low, high
+    while b - a > 4:
+        c = b - int(round((b - a) * PHI))
+        d = a + int(round((b - a) * PHI))
+        yield [c, d]
+        if values[c] >= values[d]:
+            b = d
+        else:
+            a = c
+    yield range(a, b + 1)
+
+
+class Trial(namedtuple('Trial', ['point', 'results', 'pruned'])):
+    """The results of the repetitions of a point of a sweep.
+
+    Attributes:
+        point: Dict of the Configuration fields of the point.
+        results: NumPy structured array with the result of each repetition.
+        pruned: Whether the point was stopped after its first repetitions,
+            because it could not beat the best point found.
+    """
+    __slots__ = ()
+
+    @property
+    def L(self):
+        return self.results['L'].mean()
+
+    def upper_bound(self, z):
+        """Returns the upper bound of the confidence interval on the mean L.
+        """
+        n = len(self.results)
+        if n < 2:
+            return float('inf')
+        return self.L + z * self.results['L'].std(ddof = 1) / sqrt(n)
+
+
+
+class _MemoryCache(ResultCache):
+    """A ResultCache kept in memory, for the sweeps run without a cache.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, config, repetition):
+        values = self.entries.get(self.key(config, repetition))
+        if values is None:
+            return None
+        return self._result(config, values)
+
+    def put(self, config, repetition, result):
+        key = self.key(config, repetition)
+        if key is not None:
+            self.entries[key] = self._values(config, result)
+
+
+
+class Sweep(object):
+    """Runs the points of a parameter sweep, pruning the unpromising ones.
+
+    Every point first runs a few pilot repetitions. If the upper confidence
+    bound of its mean L is below the best mean L found so far among the
+    points with the same key, it is pruned. Otherwise the rest of its
+    repetitions are run, reusing the pilot ones.
+
+    Attributes:
+        best: Trial not pruned with the highest mean L found so far, or None.
+        trials: List of all the Trials run.
+    """
+
+    def __init__(self, base=None, repetitions=REPETITIONS, pilot=5, z=1.96,
+                 workers=None, cache=None):
+        """Inits Sweep class.
+
+        Args:
+            base: Configuration whose fields are used for the ones not set by
+                the points. Defaults to Configuration().
+            repetitions: Number of repetitions of the points not pruned.
+            pilot: Number of repetitions run before deciding to prune a
+                point. Pruning is disabled if it is not below repetitions.
+            z: Normal quantile of the confidence level of the bounds.
+            workers: Workers instance shared by all the batches of the sweep.
+                If None, a temporary one is used for each batch.
+            cache: ResultCache instance. Defaults to one kept in memory.
+        """
+        self.base = base or Configuration()
+        self.repetitions = repetitions
+        self.pilot = pilot
+        self.z = z
+        self.workers = workers
+        self.cache = cache if cache is not None else _MemoryCache()
+        self.best = None
+        self.trials = []
+        self.thresholds = {} # Best mean L found so far of each key
+
+
+    def config(self, point):
+        """Returns the Configuration of a point.
+
+        Every point gets its own fixed seed, so its results can be cached.
+        """
+        config = copy.deepcopy(self.base)
+        for name, value in sorted(point.items()):
+            if name != 'S0' and not hasattr(config, name):
+                raise ValueError('unknown Configuration field: %s' % name)
+            if name != 'S0':
+                setattr(config, name, value)
+        if 'S0' in point:
+            config.Q = point['S0'] / float(config.H * (config.R or 1) *
+                                           config.C)
+        config.seed = row_seed(tuple(sorted(point.items())))
+        return Cognon().prepare(config, self.repetitions)[0]
+
+
+    def run(self, points, keys=None):
+        """Runs a batch of points.
+
+        Args:
+            points: Points to run.
+            keys: Optional list with a key of each point. Points are only
+                pruned by the points with the same key. By default all the
+                points share the same key.
+
+        Returns:
+            A list with the Trial of each point.
+        """
+        points = list(points)
+        keys = [None] * len(points) if keys is None else list(keys)
+        configs = [self.config(point) for point in points]
+
+        trials = [None] * len(points)
+        pruned = [False] * len(points)
+        if self.pilot < self.repetitions:
+            results = self._run(configs, self.pilot)
+            trials = [Trial(p, r, True) for p, r in zip(points, results)]
+            self._update(keys, trials)
+            pruned = [t.upper_bound(self.z) < self.thresholds[key]
+                      for key, t in zip(keys, trials)]
+
+        # The pilot repetitions are taken from the cache
+        survivors = [c for c, p in zip(configs, pruned) if not p]
+        results = iter(self._run(survivors, self.repetitions))
+        for k, point in enumerate(points):
+            if not pruned[k]:
+                trials[k] = Trial(point, next(results), False)
+        self._update(keys, trials)
+        self.trials.extend(trials)
+        return trials
+
+
+    def optimize_w(self, points, low, high):
+        """Searches the number of training words w that maximizes the mean L
+        of each point.
+
+        The searches of all the points run in lockstep, so that each step is
+        a single batch for the workers. The values of w of a point are only
+        pruned by the other values of w of the same point.
+
+        Args:
+            points: Points to optimize, without w.
+            low: Lower bound of w.
+            high: Upper bound of w.
+
+        Returns:
+            A list with the best Trial of each point that was not pruned.
+        """
+        points = list(points)
+        tables = [{} for point in points]
+        trials = [{} for point in points]
+        searches = [golden_section(low, high, table) for table in tables]
+        requests = [next(search) for search in searches]
+
+        while any(ws is not None for ws in requests):
+            todo = [(k, w) for k, ws in enumerate(requests) if ws is not None
+                    for w in ws if w not in tables[k]]
+            batch = self.run([dict(points[k], w = w) for k, w in todo],
+                             [k for k, w in todo])
+            for (k, w), trial in zip(todo, batch):
+                tables[k][w] = trial.L
+                trials[k][w] = trial
+            requests = [next(search, None) if ws is not None else None
+                        for search, ws in zip(searches, requests)]
+
+        # In every batch the best pilot of a point is never pruned, so every
+        # point has trials that were not pruned
+        return [max([trial for trial in t.values() if not trial.pruned],
+                    key = lambda trial: trial.L) for t in trials]
+
+
+    def _run(self, configs, repetitions):
+        if not configs:
+            return []
+        return Cognon().run_configurations(configs, repetitions,
+                                           self.workers, self.cache)
+
+
+    def _update(self, keys, trials):
+        for key, trial in zip(keys, trials):
+            self.thresholds[key] = max(self.thresholds.get(key, trial.L),
+                                       trial.L)
+            if not trial.pruned and (self.best is None or
+                                     trial.L > self.best.L):
+                self.best = trial
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--low', type=int, default=1,
+                        help='lower bound of w (default: 1)')
+    parser.add_argument('--high', type=int, default=1000,
+                        help='upper bound of w (default: 1000)')
+    parser.add_argument('-r', dest='repetitions', type=int,
+                        default=REPETITIONS,
+                        help='repetitions per point (default: %d)' %
+                             REPETITIONS)
+    parser.add_argument('--pilot', type=int, default=5,
+                        help='repetitions before pruning (default: 5)')
+    args = parser.parse_args(argv)
+
+    base = Configuration()
+    base.neuron_params(C = 1, D1 = 1, D2 = 1)
+    base.test_params(num_active = None, num_test_words = 5000)
+
+    rows = [row for rows in TABLE23 for row in rows]
+    points = [{'H': float(H), 'G': G, 'S0': S, 'R': R}
+              for H, G, S, R, w in rows]
+    with Workers() as workers:
+        sweep = Sweep(base, args.repetitions, args.pilot, workers = workers)
+        best = sweep.optimize_w(points, args.low, args.high)
+
+    print 'H\tG\tS0\tR\tw\tL\ttable w'
+    for (H, G, S, R, w), trial in zip(rows, best):
+        print '%d\t%.1f\t%d\t%d\t%d\t%.1f\t%d' % (H, G, S, R,
+                                                   trial.point['w'], trial.L,
+                                                   w)
+    pruned = sum(trial.pruned for trial in sweep.trials)
+    print '%d points run, %d pruned' % (len(sweep.trials), pruned)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from benchmarks import suite
+
+from nose.tools import assert_true
+from nose.tools import eq_
+
+import json
+
+
+class TestSuite:
+
+    def test_parameters(self):
+        eq_(list(suite.parameters({'b': [1, 2], 'a': ['x']})),
+            [{'a': 'x', 'b': 1}, {'a': 'x', 'b': 2}])
+
+    def test_run(self):
+        results = suite.run('^basic_expose$', repeat = 2, min_time = 0,
+                            out = None)
+        eq_(len(results['results']), 6)
+        for timing in results['results']:
+            eq_(timing['name'], 'basic_expose')
+            eq_(timing['repeat'], 2)
+            assert_true(0 < timing['best'] <= timing['mean'])
+        json.dumps(results)
+
+    def test_compare(self):
+        old = {'results': [{'name': 'a', 'params': {'n': [1, 2]}, 'best': 1.0},
+                           {'name': 'b', 'params': {}, 'best': 1.0}]}
+        new = {'results': [{'name': 'a', 'params': {'n': (1, 2)}, 'best': 1.5},
+                           {'name': 'b', 'params': {}, 'best': 1.1},
+                           {'name': 'c', 'params': {}, 'best': 9.0}]}
+        eq_(suite.compare(new, old), [('a', '{"n": [1, 2]}', 1.5)])
@@ -18,14 +18,45 @@
 #
 
 from cognon_basic import Neuron
+from cognon_basic import PackedNeuron
+from cognon_basic import PackedWordSet
+from cognon_basic import false_positive_rate
+from cognon_basic import popcount
 from cognon_basic import Word
+from cognon_basic import WordSet
 
+from nose.tools import assert_almost_equal
 from nose.tools import assert_false
 from nose.tools import assert_in
 from nose.tools import assert_true
 from nose.tools import eq_
 from nose.tools import raises
 
+import numpy as np
+
+
+class TestFalsePositiveRate:
+
+    def test_small(self):
+        assert_almost_equal(false_positive_rate(4, 2.0, 2.0, 2, 2), 1/6.0)
+
+    def test_untrained(self):
+        eq_(false_positive_rate(100, 4.0, 2.0, 6, 0), 0.0)
+        eq_(false_positive_rate(100, 4.0, 2.0, 8, 0), 1.0)
+
+    def test_all_strong(self):
+        eq_(false_positive_rate(100, 4.0, 2.0, 4, 100), 1.0)
+        eq_(false_positive_rate(100, 4.0, 2.0, 3, 100), 0.0)
+
+    def test_threshold(self):
+        # 19 weak and 9 strong synapses meet 19*1.9 only in exact arithmetic
+        eq_(false_positive_rate(28, 19.0, 1.9, 28, 9), 1.0)
+        eq_(false_positive_rate(28, 19.0, 1.9, 27, 9), 0.0)
+
+    def test_large(self):
+        p = false_positive_rate(10000, 20.0, 100, 22, 3000)
+        assert_true(0 < p < 1)
+
 
 class TestWord:
 
@@ -45,6 +76,39 @@ class TestWord:
         assert_in(8, w.offset)
 
 
+class TestWordSet:
+
+    def test_small(self):
+        ws = WordSet(5, 16, 4)
+        eq_(len(ws), 5)
+        eq_(len(ws.words), 5)
+        eq_(list(ws.indptr), [0, 4, 8, 12, 16, 20])
+        for word in ws.words:
+            eq_(len(word.offset), 4)
+            for offset in word.offset:
+                assert_true(0 <= offset < 16)
+
+    def test_set_words(self):
+        ws = WordSet(2, 16, 4)
+        ws.words = [Word([1,6,9]), Word([3])]
+        eq_(len(ws), 2)
+        eq_(list(ws.indptr), [0, 3, 4])
+        eq_(sorted(ws.offsets[:3]), [1, 6, 9])
+        eq_(ws.words[1].offset, set([3]))
+
+
+class TestPackedWordSet:
+
+    def test_pack(self):
+        ws = WordSet(2, 12, 3)
+        ws.words = [Word([0,7,11]), Word([3])]
+        packed = ws.pack(12)
+        eq_(len(packed), 2)
+        eq_(packed.bits.shape, (2, 2))
+        eq_(list(popcount(packed.bits)), [3, 1])
+        eq_([w.offset for w in packed.words], [set([0,7,11]), set([3])])
+
+
 class TestNeuron:
 
     def test_defaults(self):
@@ -93,3 +157,107 @@ class TestNeuron:
         w = Word()
         assert_false(n.train(w))
 
+    def test_expose_many(self):
+        n = Neuron(16, 4.0, 2.0)
+        n.strength[[1, 4, 9, 14]] = n.G
+
+        ws = WordSet(3, 16, 4)
+        ws.words = [Word([1,6,9]), Word([1,4,9,14]), Word([1,3,4,5,6,8,9,14])]
+        eq_(list(n.expose_many(ws)), [False, True, True])
+
+        n.start_training()
+        eq_(list(n.expose_many(ws)), [True, True, True])
+
+    def test_threshold(self):
+        # G is not exact in binary, a word of H strong synapses meets the
+        # threshold H*G only in exact arithmetic
+        for G in (1.1, 1.9, 3.6):
+            for H in xrange(1, 40):
+                n = Neuron(S0 = 100, H = float(H), G = G)
+                n.strength[:H] = G
+                ws = WordSet(3, 100, H)
+                ws.words = [Word(range(H)), Word(range(1, H + 1)),
+                            Word(range(50, 50 + H))]
+                eq_([n.expose(w) for w in ws.words], [True, False, False])
+                eq_(list(n.expose_many(ws, 'numpy')), [True, False, False])
+
+    def test_expose_many_parity(self):
+        rng = np.random.RandomState(7)
+        for G in (1.1, 1.9, 3.6):
+            for H in (8.0, 11.0, 16.0):
+                n = Neuron(S0 = 100, H = H, G = G)
+                n.start_training()
+                n.train_many(WordSet(30, 100, int(H) + 2, rng), 'numpy')
+                n.end_training()
+                ws = WordSet(500, 100, int(H * G) + 1, rng)
+                eq_(list(n.expose_many(ws, 'numpy')),
+                    [n.expose(w) for w in ws.words])
+
+    def test_false_positive_rate_monte_carlo(self):
+        n = Neuron(S0 = 100, H = 5.0, G = 1.5)
+        n.start_training()
+        n.train_many(WordSet(10, 100, 6))
+        n.end_training()
+
+        pF = n.false_positive_rate(6)
+        fired = n.expose_many(WordSet(20000, 100, 6))
+        std = np.sqrt(pF * (1 - pF) / 20000)
+        assert_true(abs(fired.mean() - pF) < 5 * std + 1e-9)
+
+
+class TestPackedNeuron:
+
+    def test_defaults(self):
+        n = PackedNeuron()
+        eq_(n.strong.nbytes, 2)
+        eq_(list(n.strength), [1.0] * 16)
+        assert_false(n.training)
+
+    def test_train(self):
+        n = PackedNeuron(16, 4.0, 2.0)
+        n.start_training()
+        assert_true(n.train(Word([1,6,9,14])))
+        assert_true(n.train(Word([3,4,9,13])))
+        n.end_training()
+
+        assert_false(n.expose(Word([2,6,12,14])))
+        assert_false(n.expose(Word([3,7,9,13])))
+        assert_true(n.expose(Word([1,4,9,14])))
+        eq_(list(np.flatnonzero(n.strength == 2.0)), [1,3,4,6,9,13,14])
+
+    @raises(IndexError)
+    def test_expose_index_error(self):
+        n = PackedNeuron(S0 = 16)
+        n.expose(Word([16]))
+
+    def test_parity(self):
+        rng = np.random.RandomState(5)
+        for G in (1.3, 1.5, 1.9, 3.6):
+            for H in (5.0, 9.0, 13.0, 22.0):
+                n = Neuron(S0 = 100, H = H, G = G)
+                p = PackedNeuron(S0 = 100, H = H, G = G)
+                train = WordSet(20, 100, int(H) + 1, rng)
+
+                n.start_training()
+                p.start_training()
+                eq_(list(p.train_many(train.pack(100))),
+                    list(n.train_many(train)))
+                n.end_training()
+                p.end_training()
+
+                eq_(list(p.strength), list(n.strength))
+                test = WordSet(500, 100, int(H * G), rng)
+                eq_(list(p.expose_many(test)), list(n.expose_many(test)))
+                eq_(p.false_positive_rate(int(H * G)),
+                    n.false_positive_rate(int(H * G)))
+
+    def test_threshold(self):
+        # A word of H strong synapses meets the threshold H*G
+        for G in (1.3, 1.9, 3.6):
+            for H in xrange(1, 40):
+                p = PackedNeuron(S0 = 100, H = float(H), G = G)
+                p.start_training()
+                assert_true(p.train(Word(range(H))))
+                p.end_training()
+                assert_true(p.expose(Word(range(H))))
+                assert_false(p.expose(Word(range(1, H + 1))))
@@ -18,9 +18,13 @@
 #
 
 from cognon_extended import Neuron
+from cognon_extended import NeuronPopulation
 from cognon_extended import Synapse
 from cognon_extended import Word
 from cognon_extended import WordSet
+from cognon_extended import WordStream
+from cognon_extended import sample_offsets
+import kernels
 
 from nose.tools import assert_false
 from nose.tools import assert_greater_equal
@@ -33,6 +37,44 @@ from nose.tools import eq_
 from nose.tools import ok_
 from nose.tools import raises
 
+import numpy as np
+import shutil
+import tempfile
+
+
+class TestSampleOffsets:
+
+    def check_words(self, N_array, word_length):
+        offsets = sample_offsets(N_array, word_length,
+                                 np.random.RandomState(3))
+        eq_(len(offsets), sum(N_array))
+        start = 0
+        for N in N_array:
+            word = offsets[start:start+N]
+            eq_(len(set(word)), N)
+            assert_true(((word >= 0) & (word < word_length)).all())
+            start += N
+
+    def test_sparse(self):
+        self.check_words([3, 0, 5, 1, 5], 20)
+
+    def test_dense(self):
+        self.check_words([20, 15, 11], 20)
+
+    def test_mixed(self):
+        self.check_words([2, 19, 0, 7, 20, 1], 20)
+
+    def test_uniform(self):
+        # Every subset of N out of 7 synapses is as likely
+        for N in (3, 5):
+            offsets = sample_offsets([N] * 35000, 7, np.random.RandomState(1))
+            words = np.sort(offsets.reshape(-1, N), axis=1)
+            counts = np.unique(words.dot(7 ** np.arange(N)),
+                               return_counts=True)[1]
+            expected = 35000.0 / len(counts)
+            eq_(len(counts), 35 if N == 3 else 21)
+            assert_less(((counts - expected)**2 / expected).sum(), 80)
+
 
 class TestSynapse:
 
@@ -40,6 +82,11 @@ class TestSynapse:
     def test_construct_requires_args(self):
         s = Synapse()
 
+    @raises(AttributeError)
+    def test_slots(self):
+        s = Synapse(1, 2)
+        s.strength = 1.0
+
     def test_named_attributes(self):
         s = Synapse(1, 0)
         eq_(s.offset, 1)
@@ -68,6 +115,24 @@ class TestWord:
         for offset, delay in w.synapses:
             eq_(delay, 0)
 
+    def test_arrays(self):
+        w = Word([(1,2),(3,0),(8,1)])
+        eq_(list(w.offsets), [1, 3, 8])
+        eq_(list(w.delays), [2, 0, 1])
+
+    def test_from_arrays(self):
+        offsets = np.array([4, 2])
+        delays = np.array([0, 3])
+        w = Word.from_arrays(offsets, delays)
+        eq_(w.synapses, [(4,0), (2,3)])
+        offsets[0] = 5
+        eq_(w.synapses[0].offset, 5)
+
+    @raises(AttributeError)
+    def test_slots(self):
+        w = Word()
+        w.strength = 1.0
+
 
 class TestWordSet:
 
@@ -110,6 +175,137 @@ class TestWordSet:
                 assert_greater_equal(synapse.delay, 0)
                 assert_less(synapse.delay, num_delays)
 
+    def test_rng(self):
+        ws1 = WordSet(10, 100, 4, None, 10, np.random.RandomState(5))
+        ws2 = WordSet(10, 100, 4, None, 10, np.random.RandomState(5))
+        eq_(list(ws1.indptr), list(ws2.indptr))
+        eq_(list(ws1.synapse_offsets), list(ws2.synapse_offsets))
+        eq_(list(ws1.synapse_delays), list(ws2.synapse_delays))
+
+    def test_arrays(self):
+        ws = WordSet(6, 16, 4, 3)
+
+        eq_(len(ws), 6)
+        eq_(list(ws.indptr), [0, 3, 6, 9, 12, 15, 18])
+        eq_(len(ws.synapse_offsets), 18)
+        eq_(len(ws.synapse_delays), 18)
+        for i, word in enumerate(ws.words):
+            eq_(list(word.offsets), list(ws.synapse_offsets[3*i:3*i+3]))
+            eq_(list(word.delays), list(ws.synapse_delays[3*i:3*i+3]))
+            eq_(len(set(word.offsets)), 3)
+        eq_(ws.words[-1].synapses, ws.words[5].synapses)
+
+    def test_compact(self):
+        ws1 = WordSet(10, 100, 4, 5, rng = np.random.RandomState(5))
+        ws2 = WordSet(10, 100, 4, 5, rng = np.random.RandomState(5),
+                      compact = True)
+        eq_(ws2.synapse_offsets.dtype, np.uint16)
+        eq_(ws2.synapse_delays.dtype, np.uint8)
+        eq_(list(ws1.synapse_offsets), list(ws2.synapse_offsets))
+        eq_(list(ws1.synapse_delays), list(ws2.synapse_delays))
+        eq_(ws2.slice(2, 4).synapse_offsets.dtype, np.uint16)
+
+    @raises(ValueError)
+    def test_compact_too_many_delays(self):
+        WordSet(10, 100, 300, 5, compact = True)
+
+    def test_slice(self):
+        ws = WordSet(6, 16, 4, None, 4)
+        part = ws.slice(2, 5)
+        eq_(len(part), 3)
+        eq_(part.indptr[0], 0)
+        for i in range(3):
+            eq_(part.words[i].synapses, ws.words[i + 2].synapses)
+
+    def test_take(self):
+        ws = WordSet(6, 16, 4, None, 5)
+        taken = ws.take([4, 1, 1])
+        eq_(len(taken), 3)
+        for i, j in enumerate([4, 1, 1]):
+            eq_(taken.words[i].synapses, ws.words[j].synapses)
+        eq_(len(ws.take([])), 0)
+
+    def test_inverted_index(self):
+        ws = WordSet(50, 30, 2, None, 6)
+        indptr, words = ws.inverted_index(30)
+        eq_(len(indptr), 31)
+        for o in xrange(30):
+            expected = [i for i, w in enumerate(ws.words) if o in w.offsets]
+            eq_(list(words[indptr[o]:indptr[o+1]]), expected)
+        assert_true(ws.inverted_index(30)[1] is words)
+
+    def test_chunks(self):
+        ws = WordSet(7, 16, 4, 3)
+        eq_([len(c) for c in ws.chunks()], [7])
+        chunks = list(ws.chunks(3))
+        eq_([len(c) for c in chunks], [3, 3, 1])
+        eq_(chunks[2].words[0].synapses, ws.words[6].synapses)
+
+    @raises(IndexError)
+    def test_words_index_error(self):
+        ws = WordSet(2, 16, 4, 3)
+        ws.words[2]
+
+    def test_set_words(self):
+        ws = WordSet(2, 16, 4, 3)
+        ws.words = [Word([(1,0), (6,1)]), Word(), Word([(3,2)])]
+
+        eq_(len(ws), 3)
+        eq_(len(ws.delays), 3)
+        eq_(list(ws.indptr), [0, 2, 2, 3])
+        eq_(list(ws.synapse_offsets), [1, 6, 3])
+        eq_(list(ws.synapse_delays), [0, 1, 2])
+        eq_(ws.words[0].synapses, [(1,0), (6,1)])
+        eq_(ws.words[1].synapses, [])
+
+
+class TestWordSetFiles:
+
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+    def test_save_open(self):
+        ws = WordSet(20, 100, 4, None, 10, compact = True)
+        ws.save(self.path)
+
+        for mmap in (True, False):
+            loaded = WordSet.open(self.path, mmap)
+            eq_(isinstance(loaded.indptr, np.memmap), mmap)
+            eq_(len(loaded), 20)
+            eq_(loaded.synapse_offsets.dtype, np.uint16)
+            for name in ('synapse_offsets', 'synapse_delays', 'indptr'):
+                eq_(list(getattr(loaded, name)), list(getattr(ws, name)))
+            eq_((loaded.word_length, loaded.num_delays), (100, 4))
+            eq_(loaded.slice(2, 5).word_length, 100)
+            eq_(loaded.take([3, 1]).num_delays, 4)
+
+    @raises(ValueError)
+    def test_read_only(self):
+        WordSet(5, 16, 2, 3).save(self.path)
+        WordSet.open(self.path).synapse_offsets[0] = 1
+
+
+class TestWordStream:
+
+    def test_chunks(self):
+        stream = WordStream(25, 16, 4, 3, chunk_size = 10)
+        eq_(len(stream), 25)
+        chunks = list(stream.chunks())
+        eq_([len(c) for c in chunks], [10, 10, 5])
+        for chunk in chunks:
+            eq_(list(np.diff(chunk.indptr)), [3] * len(chunk))
+            assert_true((chunk.synapse_offsets < 16).all())
+            assert_true((chunk.synapse_delays < 4).all())
+
+    def test_rng(self):
+        s1 = WordStream(25, 16, 4, None, 4, np.random.RandomState(3), 10)
+        s2 = WordStream(25, 16, 4, None, 4, np.random.RandomState(3), 10)
+        for c1, c2 in zip(s1.chunks(), s2.chunks()):
+            eq_(list(c1.synapse_offsets), list(c2.synapse_offsets))
+
 
 class TestNeuron:
 
@@ -129,6 +325,11 @@ class TestNeuron:
         assert_true((n.synapses['container'] >= 0).all())
         assert_true((n.synapses['container'] < n.C).all())
 
+    def test_rng(self):
+        n1 = Neuron(C = 3, rng = np.random.RandomState(5))
+        n2 = Neuron(C = 3, rng = np.random.RandomState(5))
+        assert_true((n1.synapses == n2.synapses).all())
+
     def test_attributes_in_range(self):
         n = Neuron()
         assert_greater_equal(n.H, 1.0)
@@ -233,6 +434,24 @@ class TestNeuron:
         assert_is_none(delay)
         assert_is_none(container)
 
+    def test_expose_first_bin(self):
+        n = Neuron(S0 = 16, H = 2.0, G = 2.0, C = 2, D1 = 2, D2 = 2)
+        n.synapses['delay'] = 0
+        n.synapses['container'][0:8] = 0
+        n.synapses['container'][8:16] = 1
+
+        # Both (1, 0) and (0, 1) fire, the earliest delay wins
+        w = Word([(1,1), (2,1), (3,1), (4,1), (9,0), (10,0), (11,0), (12,0)])
+        fired, delay, container = n.expose(w)
+        assert_true(fired)
+        eq_(delay, 0)
+        eq_(container, 1)
+
+        n.start_training()
+        assert_true(n.train(w))
+        eq_(list(np.flatnonzero(n.synapses['strength'] == n.G)),
+            [9, 10, 11, 12])
+
     def test_train(self):
         n = Neuron(S0 = 16, H = 4.0, G = 2.0, C = 1, D1 = 1, D2 = 1)
 
@@ -263,6 +482,136 @@ class TestNeuron:
         w = Word()
         assert_false(n.train(w))
 
+    def test_expose_many(self):
+        n = Neuron(S0 = 16, H = 2.0, G = 2.0, C = 1, D1 = 2, D2 = 3)
+        n.synapses['delay'][ 0:10] = 0
+        n.synapses['delay'][10:14] = 1
+        n.synapses['delay'][14:16] = 2
+
+        ws = WordSet(4, 16, 2, 4)
+        ws.words = [Word([(1,0), (2,0), (6,0)]),
+                    Word([(1,1), (2,1), (3,1), (4,1), (5,0), (6,0)]),
+                    Word([(10,1), (11,1), (12,1), (13,1)]),
+                    Word()]
+        fired, delay, container = n.expose_many(ws)
+        eq_(list(fired), [False, True, True, False])
+        eq_(list(delay), [-1, 1, 2, -1])
+        eq_(list(container), [-1, 0, 0, -1])
+
+    def test_expose_many_matches_expose(self):
+        n = Neuron(S0 = 100, H = 3.0, G = 2.0, C = 3, D1 = 3, D2 = 4)
+        n.synapses['strength'][::3] = n.G
+        ws = WordSet(200, 100, 3, None, 10)
+
+        for training in (False, True):
+            n.training = training
+            fired, delay, container = n.expose_many(ws)
+            for i, w in enumerate(ws.words):
+                f, d, c = n.expose(w)
+                eq_(fired[i], f)
+                eq_(delay[i], -1 if d is None else d)
+                eq_(container[i], -1 if c is None else c)
+
+    def test_compact(self):
+        n = Neuron(S0 = 100, H = 3.0, G = 1.5, C = 3, D1 = 3, D2 = 4,
+                   compact = True)
+        eq_(n.synapses.itemsize, 4)
+        eq_(n.synapses['strength'].dtype, np.float16)
+
+        m = Neuron(S0 = 100, H = 3.0, G = 1.5, C = 3, D1 = 3, D2 = 4)
+        for name in m.synapses.dtype.names:
+            m.synapses[name] = n.synapses[name]
+        train = WordSet(20, 100, 3, None, 10)
+        test = WordSet(200, 100, 3, None, 10, compact = True)
+
+        for neuron in (n, m):
+            neuron.start_training()
+            neuron.train_many(train, 'numpy')
+            neuron.finish_training()
+        eq_(list(n.synapses['strength']), list(m.synapses['strength']))
+        for f, f_ref in zip(n.expose_many(test, 'numpy'),
+                            m.expose_many(test, 'numpy')):
+            eq_(list(f), list(f_ref))
+
+    @raises(ValueError)
+    def test_compact_inexact_G(self):
+        Neuron(G = 1.1, compact = True)
+
+    def test_train_batched(self):
+        for S0, H, C, D1, D2, R, w in [(200, 3.0, 2, 2, 3, 20, 500),
+                                       (100, 2.0, 1, 2, 2, 20, 300),
+                                       (2000, 5.0, 3, 4, 7, 50, 1000)]:
+            for block_size in (1, 7, 1024):
+                n = Neuron(S0, H, 1.9, C, D1, D2)
+                m = Neuron(S0, H, 1.9, C, D1, D2)
+                m.synapses = n.synapses.copy()
+                ws = WordSet(w, S0, D1, None, R)
+
+                n.start_training()
+                m.start_training()
+                fired = n.train_batched(ws, block_size)
+                eq_(list(fired), list(m.train_many(ws, 'numpy')))
+                assert_true((n.synapses == m.synapses).all())
+
+    def test_train_batched_compact(self):
+        n = Neuron(200, 3.0, 1.5, 2, 2, 3, compact = True)
+        m = Neuron(200, 3.0, 1.5, 2, 2, 3)
+        for name in m.synapses.dtype.names:
+            m.synapses[name] = n.synapses[name]
+        ws = WordSet(300, 200, 2, None, 20, compact = True)
+
+        n.start_training()
+        m.start_training()
+        eq_(list(n.train_batched(ws)), list(m.train_many(ws, 'numpy')))
+        eq_(list(n.synapses['strength']), list(m.synapses['strength']))
+
+    def test_train_batched_not_training(self):
+        n = Neuron()
+        eq_(list(n.train_batched(WordSet(3, 200, 4, 5))), [False] * 3)
+
+    def test_candidates(self):
+        n = Neuron(S0 = 300, H = 4.0, G = 1.5, C = 2, D1 = 2, D2 = 3)
+        n.synapses['strength'][::7] = n.G
+        ws = WordSet(2000, 300, 2, None, 8)
+
+        for training in (False, True):
+            n.training = training
+            fired = n.expose_many(ws, 'numpy')[0]
+            candidates = n.candidates(ws)
+            assert_false((fired & ~candidates).any())
+            assert_less(candidates.mean(), 1.0)
+
+            for backend in ('numpy', 'python'):
+                for f, f_ref in zip(n.expose_many(ws, backend, True),
+                                    n.expose_many(ws, 'numpy')):
+                    eq_(list(f), list(f_ref))
+
+    def test_threshold(self):
+        # G is not exact in binary, a trained word of H synapses meets the
+        # threshold H*G only in exact arithmetic
+        backends = ['numpy', 'python']
+        if kernels.numba is not None:
+            backends.append('numba')
+        for G in (1.9, 3.6):
+            for H in xrange(1, 40):
+                n = Neuron(S0 = 100, H = float(H), G = G, C = 1, D1 = 1,
+                           D2 = 1)
+                trained = Word([(o, 0) for o in xrange(H)])
+                weak = Word([(o, 0) for o in xrange(1, H + 1)])
+                n.start_training()
+                assert_true(n.train(trained))
+                n.finish_training()
+
+                eq_(n.expose(trained), (True, 0, 0))
+                eq_(n.expose(weak), (False, None, None))
+                ws = WordSet(2, 100, 1, 1)
+                ws.words = [trained, weak]
+                for backend in backends:
+                    eq_(list(n.expose_many(ws, backend)[0]), [True, False])
+                eq_(list(n.candidates(ws)), [True, False])
+                p = NeuronPopulation.from_neurons([n, n])
+                eq_(list(p.expose([trained, weak])[0]), [True, False])
+
     def test_train_with_delays(self):
         n = Neuron(S0 = 16, H = 4.0, G = 2.0, C = 1, D1 = 2, D2 = 2)
 
@@ -294,3 +643,55 @@ class TestNeuron:
         assert_false(fired)
 
 
+class TestNeuronPopulation:
+
+    def test_defaults(self):
+        p = NeuronPopulation(3)
+        eq_(p.size, 3)
+        eq_(p.S0, 200)
+        eq_(p.strength.shape, (3, 200))
+        eq_(p.delay.shape, (3, 200))
+        eq_(p.container.shape, (3, 200))
+        assert_true((p.strength == 1.0).all())
+        assert_true((p.delay < p.D2).all())
+        assert_true((p.container < p.C).all())
+        assert_false(p.training)
+
+    def test_expose_matches_neurons(self):
+        neurons = [Neuron(S0 = 50, H = 3.0, G = 2.0, C = 2, D1 = 2, D2 = 3)
+                   for i in range(4)]
+        p = NeuronPopulation.from_neurons(neurons)
+
+        ws = WordSet(20, 50, 2, 8)
+        for w in ws.words:
+            fired, delay, container = p.expose(w)
+            for i, n in enumerate(neurons):
+                f, d, c = n.expose(w)
+                eq_(fired[i], f)
+                eq_(delay[i], -1 if d is None else d)
+                eq_(container[i], -1 if c is None else c)
+
+    def test_train_matches_neurons(self):
+        neurons = [Neuron(S0 = 50, H = 3.0, G = 2.0, C = 2, D1 = 2, D2 = 3)
+                   for i in range(4)]
+        p = NeuronPopulation.from_neurons(neurons)
+
+        wordsets = [WordSet(20, 50, 2, 8) for n in neurons]
+
+        p.start_training()
+        for n in neurons:
+            n.start_training()
+        for words in zip(*[ws.words for ws in wordsets]):
+            fired = p.train(words)
+            for i, n in enumerate(neurons):
+                eq_(fired[i], n.train(words[i]))
+        p.finish_training()
+
+        for i, n in enumerate(neurons):
+            assert_true((p.strength[i] == n.synapses['strength']).all())
+            assert_true((p.neuron(i).synapses == n.synapses).all())
+
+    def test_train_not_training(self):
+        p = NeuronPopulation(2)
+        w = Word()
+        assert_false(p.train(w).any())
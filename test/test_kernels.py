@@ -0,0 +1,139 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import cognon_basic
+import cognon_extended
+import kernels
+
+from nose.tools import assert_true
+from nose.tools import eq_
+from nose.tools import raises
+
+from unittest.case import SkipTest
+
+import numpy as np
+import types
+
+
+def train_extended_neurons(backend, compact=False, G=2.0):
+    reference = cognon_extended.Neuron(S0 = 200, H = 4.0, G = G, C = 2,
+                                       D1 = 3, D2 = 4)
+    neuron = cognon_extended.Neuron(200, 4.0, G, 2, 3, 4, compact=compact)
+    for name in reference.synapses.dtype.names:
+        neuron.synapses[name] = reference.synapses[name]
+    wordset = cognon_extended.WordSet(300, 200, 3, None, 15)
+    test_wordset = cognon_extended.WordSet(300, 200, 3, None, 15)
+    test_wordset.words = list(wordset.words) + list(test_wordset.words)
+    if compact:
+        wordset.synapse_offsets = wordset.synapse_offsets.astype(np.uint16)
+        wordset.synapse_delays = wordset.synapse_delays.astype(np.uint8)
+
+    reference.start_training()
+    fired_ref = np.array([reference.train(w) for w in wordset.words])
+    reference.finish_training()
+
+    neuron.start_training()
+    fired = neuron.train_many(wordset, backend)
+    neuron.finish_training()
+
+    eq_(list(fired), list(fired_ref))
+    for name in reference.synapses.dtype.names:
+        eq_(list(neuron.synapses[name]), list(reference.synapses[name]))
+
+    for f, f_ref in zip(neuron.expose_many(test_wordset, backend),
+                        reference.expose_many(test_wordset, 'numpy')):
+        eq_(list(f), list(f_ref))
+
+
+def train_basic_neurons(backend, G=1.5):
+    # The words of H synapses meet the threshold H*G once trained, which
+    # only holds in exact arithmetic if G is not exact in binary
+    reference = cognon_basic.Neuron(S0 = 200, H = 10.0, G = G)
+    neuron = cognon_basic.Neuron(S0 = 200, H = 10.0, G = G)
+    wordset = cognon_basic.WordSet(20, 200, 10)
+
+    reference.start_training()
+    fired_ref = np.array([reference.train(w) for w in wordset.words])
+    reference.end_training()
+
+    neuron.start_training()
+    fired = neuron.train_many(wordset, backend)
+    neuron.end_training()
+
+    eq_(list(fired), list(fired_ref))
+    eq_(list(neuron.strength), list(reference.strength))
+
+    test_wordset = cognon_basic.WordSet(300, 200, 15)
+    test_wordset.words = list(wordset.words) + list(test_wordset.words)
+    eq_(list(neuron.expose_many(test_wordset, backend)),
+        [reference.expose(w) for w in test_wordset.words])
+
+
+class TestBackends:
+
+    def test_resolve_default(self):
+        if kernels.numba is None:
+            eq_(kernels.resolve_backend(), 'numpy')
+        else:
+            eq_(kernels.resolve_backend(), 'numba')
+
+    @raises(ValueError)
+    def test_resolve_unknown(self):
+        kernels.resolve_backend('fortran')
+
+
+class TestPython:
+
+    def test_extended(self):
+        for G in (1.9, 2.0, 3.6):
+            train_extended_neurons('python', G=G)
+
+    def test_extended_compact(self):
+        train_extended_neurons('python', compact=True)
+
+    def test_basic(self):
+        for G in (1.1, 1.5, 1.9):
+            train_basic_neurons('python', G)
+
+    def test_interpreted(self):
+        # Only plain functions, not compiled ones, are called
+        for name in ('expose_extended', 'train_extended', 'expose_basic'):
+            kernel = kernels.get_kernel(name, 'python')
+            eq_(type(kernel), types.FunctionType)
+            for helper in ('fires', '_first_bin', '_count_strong'):
+                eq_(type(kernel.__globals__[helper]), types.FunctionType)
+
+
+class TestNumba:
+
+    def setup(self):
+        if kernels.numba is None:
+            raise SkipTest
+
+    def test_extended(self):
+        for G in (1.9, 2.0, 3.6):
+            train_extended_neurons('numba', G=G)
+
+    def test_extended_compact(self):
+        train_extended_neurons('numba', compact=True)
+
+    def test_basic(self):
+        for G in (1.1, 1.5, 1.9):
+            train_basic_neurons('numba', G)
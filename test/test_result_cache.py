@@ -0,0 +1,158 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from cognon_extended import WordSet
+from result_cache import ResultCache
+from result_cache import model_version
+from run_experiment import Cognon
+from run_experiment import Configuration
+from run_experiment import Workers
+
+from nose.tools import assert_is_none
+from nose.tools import eq_
+from nose.tools import ok_
+
+import numpy as np
+import shutil
+import tempfile
+
+
+def small_config(seed = 1):
+    config = Configuration()
+    config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 5, G = 2, H = 3)
+    config.test_params(num_active = 6, w = 5, num_test_words = 100)
+    config.seed = seed
+    return config
+
+
+class TestResultCache:
+
+    def setup(self):
+        self.path = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+    def test_model_version(self):
+        eq_(model_version(), model_version())
+        eq_(len(model_version()), 40)
+
+    def test_put_get(self):
+        cache = ResultCache(self.path)
+        config = small_config()
+        assert_is_none(cache.get(config, 0))
+        cache.put(config, 0, (0.5, 0.25, 1.5))
+        eq_(cache.get(config, 0), (0.5, 0.25, 1.5))
+        assert_is_none(cache.get(config, 1))
+        assert_is_none(cache.get(small_config(seed = 2), 0))
+
+    def test_config_fields(self):
+        cache = ResultCache(self.path)
+        cache.put(small_config(), 0, (0.5, 0.25, 1.5))
+        config = small_config()
+        config.H = 4
+        assert_is_none(cache.get(config, 0))
+
+    def test_execution_fields(self):
+        cache = ResultCache(self.path)
+        cache.put(small_config(), 0, (0.5, 0.25, 1.5))
+        for name in ('prefilter', 'batched_training'):
+            config = small_config()
+            setattr(config, name, True)
+            eq_(cache.get(config, 0), (0.5, 0.25, 1.5))
+
+    def test_profile(self):
+        cache = ResultCache(self.path)
+        config = small_config()
+        config.profile = True
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 1, workers, cache)
+
+        # Only the results are cached, the times are not
+        eq_(cache.get(small_config(), 0), tuple(r[0])[:3])
+        cached = cache.get(config, 0)
+        eq_(cached[:3], tuple(r[0])[:3])
+        ok_(np.isnan(cached[3:]).all())
+        with Workers(processes = 1) as workers:
+            r2 = Cognon().run_configuration(config, 1, workers, cache)
+        eq_(r2.dtype, r.dtype)
+        eq_(tuple(r2[0])[:3], tuple(r[0])[:3])
+
+    def test_test_corpus(self):
+        cache = ResultCache(self.path)
+        config = small_config()
+        config.test_corpus = tempfile.mkdtemp()
+        try:
+            WordSet(10, 25, 1, 6, rng = np.random.RandomState(1)).save(
+                    config.test_corpus)
+            cache.put(config, 0, (0.5, 0.25, 1.5))
+            eq_(cache.get(config, 0), (0.5, 0.25, 1.5))
+
+            # A corpus saved again at the same path is a new corpus
+            WordSet(12, 25, 1, 6, rng = np.random.RandomState(2)).save(
+                    config.test_corpus)
+            assert_is_none(cache.get(config, 0))
+        finally:
+            shutil.rmtree(config.test_corpus)
+
+    def test_no_seed(self):
+        cache = ResultCache(self.path)
+        config = small_config(seed = None)
+        cache.put(config, 0, (0.5, 0.25, 1.5))
+        assert_is_none(cache.get(config, 0))
+
+    def test_version(self):
+        ResultCache(self.path, 'a').put(small_config(), 0, (0.5, 0.25, 1.5))
+        assert_is_none(ResultCache(self.path, 'b').get(small_config(), 0))
+        eq_(ResultCache(self.path, 'a').get(small_config(), 0),
+            (0.5, 0.25, 1.5))
+
+    def test_arrays(self):
+        cache = ResultCache(self.path)
+        config = small_config()
+        cache.put(config, 0, (np.array([0.5, 1.0]), np.array([0.1, 0.2]),
+                              np.array([1.0, 2.0])))
+        eq_(cache.get(config, 0), ([0.5, 1.0], [0.1, 0.2], [1.0, 2.0]))
+
+    def test_run_configuration(self):
+        cache = ResultCache(self.path)
+        config = small_config()
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 2, workers, cache)
+        eq_(cache.get(config, 1), tuple(r[1]))
+
+        # Cached results are not computed again
+        cache.put(config, 1, (0.5, 0.25, 1.5))
+        with Workers(processes = 1) as workers:
+            r2 = Cognon().run_configuration(config, 2, workers, cache)
+        eq_(tuple(r2[0]), tuple(r[0]))
+        eq_(tuple(r2[1]), (0.5, 0.25, 1.5))
+
+    def test_run_configuration_shared(self):
+        cache = ResultCache(self.path)
+        config = small_config()
+        cache.put(config, 1, (0.5, 0.25, 1.5))
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 2, workers, cache,
+                                           shared = True)
+        eq_(cache.get(config, 0), tuple(r[0]))
+        eq_(tuple(r[1]), (0.5, 0.25, 1.5))
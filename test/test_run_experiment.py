@@ -21,11 +21,21 @@ from run_experiment import Alice
 from run_experiment import Bob
 from run_experiment import Configuration
 from run_experiment import Cognon
+from run_experiment import SHARED_DIR
+from run_experiment import SharedResults
+from run_experiment import Profile
+from run_experiment import Workers
+from run_experiment import information
+from run_experiment import measured_information
+from run_experiment import repetition_rng
+from run_experiment import wilson_interval
 
 from cognon_extended import Neuron
 from cognon_extended import Word
 from cognon_extended import WordSet
+from cognon_extended import WordStream
 
+from nose.tools import assert_almost_equal
 from nose.tools import assert_false
 from nose.tools import assert_greater_equal
 from nose.tools import assert_in
@@ -39,6 +49,12 @@ from nose.tools import raises
 
 from unittest.case import SkipTest
 
+import numpy as np
+import os
+import pickle
+import shutil
+import tempfile
+
 
 class TestAlice:
 
@@ -67,6 +83,37 @@ class TestAlice:
         fired, delay, container = n.expose(wF)
         assert_true(fired) # False alarm
 
+    def test_checkpoints(self):
+        n = Neuron(S0 = 60, H = 3.0, G = 2.0, C = 2, D1 = 2, D2 = 2)
+        wordset = WordSet(num_words = 30, word_length = 60, num_delays = 2,
+                          num_active = 6)
+
+        references = []
+        for w in (5, 20):
+            m = Neuron(S0 = 60, H = 3.0, G = 2.0, C = 2, D1 = 2, D2 = 2)
+            m.synapses = n.synapses.copy()
+            Alice().train(m, wordset.slice(0, w))
+            references.append(m.synapses['strength'])
+
+        snapshots = Alice().train(n, wordset, [5, 20])
+        eq_(len(snapshots), 2)
+        for snapshot, reference in zip(snapshots, references):
+            assert_true((snapshot == reference).all())
+        assert_false(n.training)
+
+    def test_batched(self):
+        n = Neuron(S0 = 60, H = 3.0, G = 2.0, C = 2, D1 = 2, D2 = 2)
+        m = Neuron(S0 = 60, H = 3.0, G = 2.0, C = 2, D1 = 2, D2 = 2)
+        m.synapses = n.synapses.copy()
+        wordset = WordSet(num_words = 30, word_length = 60, num_delays = 2,
+                          num_active = 6)
+
+        snapshots = Alice(batched = True).train(n, wordset, [5, 20])
+        references = Alice().train(m, wordset, [5, 20])
+        for snapshot, reference in zip(snapshots, references):
+            assert_true((snapshot == reference).all())
+        assert_true((n.synapses == m.synapses).all())
+
 
 class TestBob:
 
@@ -97,15 +144,548 @@ class TestBob:
         eq_(bob.false_true, 1)
         eq_(bob.false_false, 2)
 
+    def test_test_stream(self):
+        n = Neuron(S0 = 16, H = 4.0, G = 2.0, C = 1, D1 = 1, D2 = 1)
+        train_wordset = WordSet(num_words = 10, word_length = 16,
+                                num_delays = 1, num_active = 4)
+        Alice().train(n, train_wordset)
+
+        test_stream = WordStream(25, 16, 1, 4, chunk_size = 10)
+        bob = Bob()
+        bob.test(n, train_wordset, test_stream)
+
+        eq_(bob.true_true + bob.true_false, 10)
+        eq_(bob.false_true + bob.false_false, 25)
+
 
 class TestConfiguration:
 
     def test_config(self):
         raise SkipTest
 
+    def test_result_names(self):
+        config = Configuration()
+        eq_(config.result_names, ('pL', 'pF', 'L'))
+        config.stopping_params(precision = 0.1)
+        eq_(config.result_names, ('pL', 'pF', 'L', 'num_test_words',
+                                  'pF_low', 'pF_high', 'L_low', 'L_high'))
+
+
+class TestProfile:
+
+    def test_phase(self):
+        profile = Profile()
+        with profile.phase('train'):
+            sum(xrange(10000))
+        with profile.phase('train'):
+            pass
+        assert_true(profile.wall['train'] > 0)
+        eq_(profile.wall['test'], 0.0)
+        assert_true(profile.rss_hwm['train'] > 0)
+
+    def test_phase_peak(self):
+        if not os.path.exists('/proc/self/clear_refs'):
+            raise SkipTest
+        profile = Profile()
+        with profile.phase('generate'):
+            a = np.ones(2**24) # 128 MB
+            del a
+        with profile.phase('train'):
+            pass
+        assert_true(profile.rss_hwm['generate'] >
+                    profile.rss_hwm['train'] + 100000)
+
+    def test_iterate(self):
+        profile = Profile()
+        eq_(list(profile.iterate('generate', xrange(3))), [0, 1, 2])
+        assert_true(profile.wall['generate'] > 0)
+
+    def test_bins_scanned(self):
+        n = Neuron(S0 = 16, H = 2.0, G = 2.0, C = 2, D1 = 1, D2 = 1)
+        n.synapses['delay'] = 0
+        n.synapses['container'] = 0
+        n.synapses['container'][8:] = 1
+
+        wordset = WordSet(3, 16, 1, 4)
+        wordset.words = [Word([(0,0), (1,0), (2,0), (3,0)]),
+                         Word([(8,0), (9,0), (10,0), (11,0)]),
+                         Word([(0,0)])]
+        bob = Bob()
+        bob.test_untrained(n, wordset)
+        eq_(bob.bins_scanned, 1 + 2 + 4)
+        eq_(Profile().values(bob)[-1], 7 / 3.0)
+
+    def test_shares(self):
+        profile = Profile()
+        profile.wall['train'] = 3.0
+        profile.cpu['train'] = 1.5
+        profile.rss_hwm['train'] = 100
+        values = dict(zip(Profile.NAMES, profile.values(Bob(), 3)))
+        eq_(values['train_wall'], 1.0)
+        eq_(values['train_cpu'], 0.5)
+        eq_(values['train_rss_hwm'], 100)
+
+    def test_run_configuration(self):
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 2, D2 = 2, Q = 10, G = 2, H = 4)
+        config.test_params(num_active = 4, w = 5, num_test_words = 1000,
+                           test_chunk_size = 300)
+        config.profile = True
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 2, workers)
+            config.checkpoints = [2, 5]
+            curve = Cognon().run_configuration(config, 2, workers)
+
+        eq_(r.dtype.names[:3], ('pL', 'pF', 'L'))
+        eq_(r.dtype.names[3:], Profile.NAMES)
+        for phase in Profile.PHASES:
+            assert_true((r[phase + '_wall'] > 0).all())
+            assert_true((r[phase + '_rss_hwm'] > 0).all())
+        assert_true(((r['bins_scanned'] >= 1) &
+                     (r['bins_scanned'] <= 8)).all())
+        eq_(curve['bins_scanned'].shape, (2, 2))
+
+
+class TestSharedResults:
+
+    def test_write_through_copy(self):
+        buffer = SharedResults([('pL', float), ('pF', float, (2,))], 3)
+        copy = pickle.loads(pickle.dumps(buffer))
+        copy.array[1] = (0.5, [0.25, 0.75])
+
+        r = buffer.release()
+        assert_false(os.path.exists(buffer.path))
+        eq_(r[1]['pL'], 0.5)
+        eq_(list(r[1]['pF']), [0.25, 0.75])
+        eq_(r[0]['pL'], 0.0)
+
+    def test_empty(self):
+        buffer = SharedResults([('pL', float)], 0)
+        copy = pickle.loads(pickle.dumps(buffer))
+        eq_(len(copy.array), 0)
+        eq_(len(buffer.release()), 0)
+        assert_false(os.path.exists(buffer.path))
+
+    def test_released_on_failure(self):
+        def files():
+            names = os.listdir(SHARED_DIR or tempfile.gettempdir())
+            return set(name for name in names if name.startswith('cognon-'))
+        before = files()
+
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 1, D2 = 1)
+        config.test_params(num_active = 4, w = 5, num_test_words = 100,
+                           analytic = True)
+        try:
+            Cognon().run_configuration(config, 2, Workers(1), shared = True)
+            ok_(False, 'the analytic run did not fail')
+        except ValueError:
+            pass
+        eq_(files(), before)
+
+        # No repetitions at all
+        eq_(len(Cognon().run_configuration(config, 0, Workers(1),
+                                           shared = True)), 0)
+        eq_(files(), before)
+
 
 class TestCognon:
 
     def test_cognon(self):
         raise SkipTest
 
+    def test_fresh_seed(self):
+        config = Configuration()
+        config.test_params(num_active = 10, w = 60, num_test_words = 200)
+        with Workers(processes = 1) as workers:
+            r = [Cognon().run_configuration(config, 8, workers)
+                 for i in range(2)]
+        ok_(config.seed is None)
+        ok_(r[0].tolist() != r[1].tolist())
+
+    def test_prepare(self):
+        config = Configuration()
+        config.test_params(num_test_words = 0)
+        prepared, N = Cognon().prepare(config, 4)
+        eq_(N, 4)
+        ok_(prepared.seed is not None)
+        eq_(prepared.num_test_words, 250000)
+        ok_(config.seed is None)
+        eq_(config.num_test_words, 0)
+        config.seed = 5
+        eq_(Cognon().prepare(config, 4)[0].seed, 5)
+
+    def test_prefilter(self):
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 2, D2 = 2, Q = 10, G = 2, H = 4)
+        config.test_params(num_active = 5, w = 5, num_test_words = 2000)
+        config.seed = 7
+
+        # The index is only used when chunks are exposed to several neurons
+        for test_group, checkpoints in [(1, None), (2, None), (1, [2, 5])]:
+            config.test_group = test_group
+            config.checkpoints = checkpoints
+            config.prefilter = False
+            r = Cognon().run_configuration(config, 2, Workers(1))
+            config.prefilter = True
+            r2 = Cognon().run_configuration(config, 2, Workers(1))
+            for name in r.dtype.names:
+                eq_(r2[name].tolist(), r[name].tolist())
+
+
+class TestRepetitionRng:
+
+    def test_reproducible(self):
+        eq_(list(repetition_rng(7, 3).randint(1000, size=5)),
+            list(repetition_rng(7, 3).randint(1000, size=5)))
+
+    def test_independent(self):
+        a = repetition_rng(7, 0).randint(2**30, size=5)
+        b = repetition_rng(7, 1).randint(2**30, size=5)
+        c = repetition_rng(8, 0).randint(2**30, size=5)
+        assert_true((a != b).any())
+        assert_true((a != c).any())
+
+    def test_large_seed(self):
+        a = repetition_rng(2**64 + 1, 0).randint(2**30, size=5)
+        b = repetition_rng(1, 0).randint(2**30, size=5)
+        assert_true((a != b).any())
+
+
+class TestInformation:
+
+    def test_perfect(self):
+        eq_(information(10, 1.0, 0.25), 20.0)
+        eq_(information(10, 1.0, 0.0), 10)
+
+    def test_no_false_positives(self):
+        eq_(information(10, 0.5, 0.0), 0)
+
+    def test_not_recognized(self):
+        eq_(information(10, 0.2, 0.3), 0)
+
+    def test_partial(self):
+        assert_true(0 < information(10, 0.9, 0.1) < 10 * 3.2)
+
+    def test_measured(self):
+        eq_(measured_information(10, 0.9, 3, 30, 1.96),
+            information(10, 0.9, 0.1))
+        eq_(measured_information(10, 0.9, 0, 30, 1.96),
+            information(10, 0.9, wilson_interval(0, 30, 1.96)[1]))
+
+    def test_measured_in_interval(self):
+        # With no false positive L is still within its interval
+        cfg = Configuration()
+        cfg.test_params(w = 50)
+        cfg.stopping_params(precision = 0.1)
+        bob = Bob()
+        bob.false_false = 4000
+        for pL in (0.5, 0.9, 1.0):
+            result = dict(zip(cfg.result_names,
+                              Cognon()._result(cfg, None, pL, bob, None, 1)))
+            assert_true(0 < result['L_low'] <= result['L'] <=
+                        result['L_high'])
+
+
+class TestWilsonInterval:
+
+    def test_contains_estimate(self):
+        low, high = wilson_interval(30, 100, 1.96)
+        assert_true(0.2 < low < 0.3 < high < 0.4)
+
+    def test_bounds(self):
+        low, high = wilson_interval(0, 100, 1.96)
+        eq_(low, 0.0)
+        assert_true(0 < high < 0.05)
+        low, high = wilson_interval(100, 100, 1.96)
+        assert_almost_equal(high, 1.0)
+
+    def test_narrows(self):
+        low1, high1 = wilson_interval(30, 100, 1.96)
+        low2, high2 = wilson_interval(300, 1000, 1.96)
+        assert_true(high2 - low2 < high1 - low1)
+
+
+class TestWorkers:
+
+    def test_serial(self):
+        with Workers(processes = 1) as workers:
+            eq_(list(workers.imap_unordered(abs, [-1, -2, 3])), [1, 2, 3])
+            assert_is_none(workers.pool)
+
+    def test_pool_is_reused(self):
+        with Workers(processes = 2) as workers:
+            eq_(sorted(workers.imap_unordered(abs, [-1, -2, 3])), [1, 2, 3])
+            pool = workers.pool
+            eq_(sorted(workers.imap_unordered(abs, [-4, 5])), [4, 5])
+            ok_(workers.pool is pool)
+        assert_is_none(workers.pool)
+
+    def test_run_configuration(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 4)
+        config.test_params(num_active = 4, w = 5, num_test_words = 100)
+
+        with Workers(processes = 2) as workers:
+            r = Cognon().run_configuration(config, 3, workers)
+
+        eq_(len(r), 3)
+        eq_(r.dtype.names, ('pL', 'pF', 'L'))
+        assert_true(((r['pL'] >= 0) & (r['pL'] <= 1)).all())
+        assert_true(((r['pF'] >= 0) & (r['pF'] <= 1)).all())
+
+    def test_shared(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 4)
+        config.test_params(num_active = 4, w = 5, num_test_words = 100)
+        config.checkpoints = [2, 5]
+        config.seed = 3
+
+        with Workers(processes = 2) as workers:
+            r = Cognon().run_configuration(config, 3, workers)
+            r2 = Cognon().run_configuration(config, 3, workers, shared = True)
+
+        eq_(r2.dtype, r.dtype)
+        for name in r.dtype.names:
+            eq_(r2[name].tolist(), r[name].tolist())
+
+    def test_reproducible_runs(self):
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 2, D2 = 3, Q = 5, G = 2, H = 3)
+        config.test_params(num_active = 10, w = 20, num_test_words = 2000)
+        config.seed = 1234
+
+        with Workers(processes = 1) as workers:
+            serial = Cognon().run_configuration(config, 4, workers)
+        with Workers(processes = 2) as workers:
+            parallel = Cognon().run_configuration(config, 4, workers)
+
+        eq_(serial.tolist(), parallel.tolist())
+        eq_(tuple(serial[2]), Cognon().run_repetition(config, 2))
+
+    def test_chunksize(self):
+        chunksizes = []
+        class RecordingWorkers(Workers):
+            def imap_unordered(self, func, tasks, chunksize=None):
+                chunksizes.append(chunksize)
+                return Workers.imap_unordered(self, func, tasks, chunksize)
+
+        config = Configuration()
+        config.test_params(num_active = 4, w = 5, num_test_words = 10)
+        config.seed = 1
+        for chunksize in (None, 3):
+            with RecordingWorkers(1, chunksize) as workers:
+                Cognon().run_configuration(config, 2, workers)
+        eq_(chunksizes, [1, 3])
+
+    def test_run_configurations(self):
+        configs = []
+        for w, H in [(5, 4), (20, 3)]:
+            config = Configuration()
+            config.neuron_params(C = 1, D1 = 2, D2 = 2, Q = 5, G = 2, H = H)
+            config.test_params(num_active = 8, w = w, num_test_words = 500)
+            config.seed = w
+            configs.append(config)
+
+        with Workers(processes = 2) as workers:
+            r = Cognon().run_configurations(configs, 3, workers)
+
+        eq_(len(r), 2)
+        for config, values in zip(configs, r):
+            eq_(len(values), 3)
+            for i in range(3):
+                eq_(tuple(values[i]), Cognon().run_repetition(config, i))
+
+
+class TestTestGroup:
+
+    def test_test_group(self):
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 2, D2 = 2, Q = 10, G = 2, H = 4)
+        config.test_params(num_active = 5, w = 5, num_test_words = 1000,
+                           test_chunk_size = 300, test_group = 3)
+        config.seed = 11
+
+        with Workers(processes = 2) as workers:
+            r = Cognon().run_configuration(config, 5, workers)
+            r2 = Cognon().run_configuration(config, 5, workers, shared = True)
+        eq_(r2.tolist(), r.tolist())
+        for i in range(5):
+            eq_(tuple(r[i]), Cognon().run_repetition(config, i))
+        eq_(Cognon().run_repetitions(config, [4, 0, 2]),
+            [tuple(r[4]), tuple(r[0]), tuple(r[2])])
+
+        # The same neuron gives the same result when it is in a group
+        group = Cognon().run_group(config, [repetition_rng(1, 0),
+                                            repetition_rng(1, 0),
+                                            repetition_rng(1, 1)],
+                                   repetition_rng(1, 2))
+        eq_(group[0], group[1])
+        eq_(group[0], Cognon().run_group(config, [repetition_rng(1, 0)],
+                                         repetition_rng(1, 2))[0])
+
+    def test_test_group_early_stopping(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 5)
+        config.test_params(num_active = 6, w = 5, num_test_words = 20000,
+                           test_group = 2)
+        config.stopping_params(precision = 0.2, batch_size = 500)
+        config.seed = 3
+
+        rngs = [repetition_rng(3, i) for i in range(2)]
+        group = Cognon().run_group(config, rngs, repetition_rng(3, 9))
+        for i in range(2):
+            eq_(group[i], Cognon().run_group(config, [repetition_rng(3, i)],
+                                             repetition_rng(3, 9))[0])
+
+    @raises(ValueError)
+    def test_test_group_checkpoints(self):
+        config = Configuration()
+        config.test_params(w = 5, num_test_words = 100, test_group = 2)
+        config.checkpoints = [2, 5]
+        config.seed = 1
+        Cognon().run_repetition(config, 0)
+
+    def test_test_group_profile(self):
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 2, D2 = 2, Q = 10, G = 2, H = 4)
+        config.test_params(num_active = 4, w = 5, num_test_words = 1000,
+                           test_group = 3)
+        config.profile = True
+        config.seed = 1
+
+        cognon = Cognon()
+        group = cognon.run_repetitions(config, [0, 1, 2])
+        wall = [dict(zip(config.result_names, r))['train_wall']
+                for r in group]
+        eq_(len(set(wall)), 1)
+
+
+class TestEarlyStopping:
+
+    def test_early_stopping(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 5)
+        config.test_params(num_active = 6, w = 5, num_test_words = 100000)
+        config.stopping_params(precision = 0.2, batch_size = 500)
+        config.seed = 5
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 2, workers)
+
+        for v in r:
+            assert_true(v['num_test_words'] < 100000)
+            eq_(v['num_test_words'] % 500, 0)
+            assert_true(v['pF_low'] <= v['pF'] <= v['pF_high'])
+            assert_less_equal(v['pF_high'] - v['pF_low'], 0.2 * v['pF'])
+            assert_less_equal(v['L_high'] - v['L_low'], 0.2 * v['L'])
+            assert_true(v['L_low'] <= v['L'] <= v['L_high'])
+
+    def test_early_stopping_budget(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 5, G = 2, H = 3)
+        config.test_params(num_active = 8, w = 10, num_test_words = 100000)
+        config.stopping_params(precision = 1e-6, max_test_words = 2000,
+                               batch_size = 500)
+        config.seed = 5
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 1, workers)
+        eq_(r[0]['num_test_words'], 2000)
+
+
+class TestTestCorpus:
+
+    def test_test_corpus(self):
+        path = tempfile.mkdtemp()
+        try:
+            WordSet(1200, 50, 1, 6).save(path)
+            config = Configuration()
+            config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 5)
+            config.test_params(num_active = 6, w = 5, num_test_words = 100000,
+                               test_corpus = path)
+            config.stopping_params(precision = 1e-6, batch_size = 500)
+            config.seed = 5
+
+            with Workers(processes = 1) as workers:
+                r = Cognon().run_configuration(config, 2, workers)
+            with Workers(processes = 2) as workers:
+                r2 = Cognon().run_configuration(config, 2, workers)
+        finally:
+            shutil.rmtree(path)
+
+        eq_(list(r['num_test_words']), [1200, 1200])
+        eq_(r.tolist(), r2.tolist())
+
+    def test_test_corpus_mismatch(self):
+        path = tempfile.mkdtemp()
+        try:
+            WordSet(100, 60, 1, 6).save(path)
+            config = Configuration()
+            config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 5)
+            config.test_params(num_active = 6, w = 5, num_test_words = 100,
+                               test_corpus = path)
+            try:
+                Cognon().run_experiment(config)
+                ok_(False, 'a corpus for S0 = 60 was accepted for S0 = 50')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(path)
+
+
+class TestAnalytic:
+
+    def test_analytic(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 5)
+        config.test_params(num_active = 6, w = 5, num_test_words = 20000)
+        config.seed = 3
+
+        with Workers(processes = 1) as workers:
+            mc = Cognon().run_configuration(config, 3, workers)
+            config.analytic = True
+            exact = Cognon().run_configuration(config, 3, workers)
+
+        eq_(list(exact['pL']), list(mc['pL']))
+        std = np.sqrt(exact['pF'] * (1 - exact['pF']) / 20000)
+        assert_true((abs(mc['pF'] - exact['pF']) < 5 * std + 1e-9).all())
+
+    @raises(ValueError)
+    def test_analytic_requires_single_bin(self):
+        config = Configuration()
+        config.test_params(num_active = 4, w = 5, analytic = True)
+        Cognon().run_experiment(config)
+
+
+class TestCheckpoints:
+
+    def test_checkpoints(self):
+        config = Configuration()
+        config.neuron_params(C = 2, D1 = 2, D2 = 2, Q = 5, G = 2, H = 4)
+        config.test_params(num_active = 8, w = 12, num_test_words = 1000)
+        config.seed = 11
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 2, workers)
+            config.checkpoints = [4, 8, 12]
+            curve = Cognon().run_configuration(config, 2, workers)
+
+        eq_(curve['L'].shape, (2, 3))
+        for name in ('pL', 'pF', 'L'):
+            eq_(list(curve[name][:, 2]), list(r[name]))
+
+    def test_checkpoints_analytic(self):
+        config = Configuration()
+        config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 5)
+        config.test_params(num_active = 6, w = 6, analytic = True)
+        config.seed = 11
+
+        with Workers(processes = 1) as workers:
+            r = Cognon().run_configuration(config, 1, workers)
+            config.checkpoints = [2, 6]
+            curve = Cognon().run_configuration(config, 1, workers)
+
+        eq_(curve['pF'][0, 1], r['pF'][0])
+        assert_less_equal(curve['pF'][0, 0], curve['pF'][0, 1])
@@ -0,0 +1,192 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from run_experiment import Cognon
+from run_experiment import Configuration
+from run_experiment import Workers
+from service import CANCELLED
+from service import Client
+from service import DONE
+from service import FAILED
+from service import QUEUED
+from service import Server
+from service import Service
+from service import make_config
+import service
+
+from nose.tools import assert_in
+from nose.tools import assert_less
+from nose.tools import assert_raises
+from nose.tools import assert_true
+from nose.tools import eq_
+from nose.tools import raises
+
+import os
+import shutil
+import tempfile
+import threading
+
+
+def _die(task):
+    os._exit(1)
+
+
+FIELDS = {'C': 1, 'D1': 2, 'D2': 2, 'Q': 5, 'G': 2, 'H': 4, 'num_active': 8,
+          'w': 5, 'num_test_words': 500, 'seed': 3}
+
+
+class TestMakeConfig:
+
+    def test_fields(self):
+        config = make_config(FIELDS)
+        for name, value in FIELDS.items():
+            eq_(getattr(config, name), value)
+
+    @raises(ValueError)
+    def test_unknown_field(self):
+        make_config({'X': 1})
+
+    @raises(ValueError)
+    def test_property(self):
+        make_config({'S0': 100})
+
+
+class TestService:
+
+    def test_results(self):
+        with Workers(processes = 2) as workers:
+            service = Service(workers, max_jobs = 2)
+            jobs = [service.submit(make_config(FIELDS), 4) for i in range(2)]
+            streamed = list(jobs[0].stream())
+            assert_true(jobs[1].wait())
+            service.close()
+
+        expected = Cognon().run_configuration(make_config(FIELDS), 4)
+        for job in jobs:
+            eq_(job.state, DONE)
+            eq_(sorted(job.results), sorted(streamed))
+            eq_([result for i, result in sorted(job.results)],
+                expected.tolist())
+
+    def test_cancel(self):
+        with Workers(processes = 1) as workers:
+            service = Service(workers, max_jobs = 1)
+            config = make_config(FIELDS)
+            config.num_test_words = 20000
+            running = service.submit(config, 1000)
+            queued = service.submit(make_config(FIELDS), 4)
+            eq_(queued.state, QUEUED)
+            service.cancel(queued.id)
+            for i, result in running.stream():
+                running.cancel()
+            assert_true(running.wait())
+            service.close()
+
+        eq_(running.state, CANCELLED)
+        assert_less(len(running.results), 1000)
+        eq_(queued.state, CANCELLED)
+        eq_(queued.results, [])
+
+    def test_failure(self):
+        with Workers(processes = 2) as workers:
+            service = Service(workers)
+            config = make_config(FIELDS)
+            config.analytic = True
+            job = service.submit(config, 2)
+            assert_true(job.wait())
+            service.close()
+        eq_(job.state, FAILED)
+        assert_in('analytic pF requires', job.error)
+
+    def test_worker_died(self):
+        run_task = service._run_task
+        service._run_task = _die
+        try:
+            with Workers(processes = 2) as workers:
+                jobs = Service(workers)
+                job = jobs.submit(make_config(FIELDS), 4)
+                assert_true(job.wait(30))
+                jobs.close()
+        finally:
+            service._run_task = run_task
+        eq_(job.state, FAILED)
+        assert_in('worker process died', job.error)
+
+    def test_remove(self):
+        with Workers(processes = 1) as workers:
+            jobs = Service(workers, max_jobs = 1)
+            config = make_config(FIELDS)
+            config.num_test_words = 20000
+            running = jobs.submit(config, 1000)
+            queued = jobs.submit(make_config(FIELDS), 4)
+            assert_raises(ValueError, jobs.remove, queued.id)
+            running.cancel()
+            assert_true(queued.wait())
+            eq_(jobs.remove(running.id), running)
+            eq_(jobs.remove(queued.id), queued)
+            eq_(jobs.jobs, {})
+            assert_raises(KeyError, jobs.remove, queued.id)
+            jobs.close()
+
+
+class TestServer:
+
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.workers = Workers(processes = 2)
+        self.service = Service(self.workers)
+        self.server = Server(os.path.join(self.dir, 'socket'), self.service)
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.start()
+        self.client = Client(os.path.join(self.dir, 'socket'))
+
+    def teardown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.service.close()
+        self.workers.close()
+        shutil.rmtree(self.dir)
+
+    def test_watch(self):
+        job = self.client.submit(FIELDS, 3)
+        results = sorted(self.client.watch(job))
+        eq_([i for i, result in results], [0, 1, 2])
+        expected = Cognon().run_configuration(make_config(FIELDS), 3)
+        eq_([result for i, result in results], expected.tolist())
+
+        jobs = self.client.jobs()
+        eq_(jobs, [{'job': job, 'state': DONE, 'results': 3,
+                    'repetitions': 3}])
+        eq_(self.client.cancel(job), DONE)
+        eq_(self.client.remove(job), DONE)
+        eq_(self.client.jobs(), [])
+
+    @raises(ValueError)
+    def test_invalid(self):
+        self.client.submit({'X': 1}, 3)
+
+    @raises(ValueError)
+    def test_unknown_job(self):
+        self.client.cancel(42)
+
+    @raises(RuntimeError)
+    def test_failure(self):
+        job = self.client.submit(dict(FIELDS, analytic = True), 2)
+        list(self.client.watch(job))
@@ -0,0 +1,133 @@
+# Copyright 2013 Pau Haro Negre
+# based on C++ code by Carl Staelin Copyright 2009-2011
+#
+# See the NOTICE file distributed with this work for additional information
+# regarding copyright ownership.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from run_experiment import Configuration
+from run_experiment import Workers
+from sweep import Sweep
+from sweep import golden_section
+from sweep import grid
+from sweep import random_points
+
+from nose.tools import assert_false
+from nose.tools import assert_greater_equal
+from nose.tools import assert_in
+from nose.tools import assert_true
+from nose.tools import eq_
+from nose.tools import raises
+
+import numpy as np
+
+
+def small_config():
+    config = Configuration()
+    config.neuron_params(C = 1, D1 = 1, D2 = 1, Q = 10, G = 2, H = 4)
+    config.test_params(num_active = 6, w = 5, num_test_words = 500)
+    return config
+
+
+class TestPoints:
+
+    def test_grid(self):
+        eq_(list(grid(H = [4, 5], w = [10])),
+            [{'H': 4, 'w': 10}, {'H': 5, 'w': 10}])
+
+    def test_random_points(self):
+        rng = np.random.RandomState(0)
+        points = list(random_points(20, rng, H = [4, 5],
+                                    w = lambda rng: rng.randint(1, 10)))
+        eq_(len(points), 20)
+        for point in points:
+            assert_in(point['H'], [4, 5])
+            assert_true(1 <= point['w'] < 10)
+
+    def test_golden_section(self):
+        for best in [1, 2, 37, 99, 100]:
+            values = {}
+            search = golden_section(1, 100, values)
+            for xs in search:
+                for x in xs:
+                    values[x] = -abs(x - best)
+            eq_(max(values, key = values.get), best)
+            assert_true(len(values) < 20)
+
+
+class TestSweep:
+
+    def test_config(self):
+        sweep = Sweep(small_config())
+        config = sweep.config({'H': 5, 'R': 2, 'S0': 100, 'w': 7})
+        eq_((config.H, config.R, config.S0, config.w), (5, 2, 100, 7))
+        eq_(config.seed, sweep.config({'S0': 100, 'w': 7, 'R': 2,
+                                       'H': 5}).seed)
+
+    def test_config_S0(self):
+        # Q*H*R is just below S0 for these
+        sweep = Sweep(small_config())
+        for H, S0, R in [(5, 1000, 333), (3, 200, 3), (3, 10000, 27)]:
+            config = sweep.config({'H': H, 'R': R, 'S0': S0})
+            eq_(config.S0, S0)
+
+    @raises(ValueError)
+    def test_unknown_field(self):
+        Sweep(small_config()).config({'X': 1})
+
+    def test_run(self):
+        sweep = Sweep(small_config(), repetitions = 4, pilot = 2)
+        trials = sweep.run([{'H': 4}, {'H': 5}])
+        eq_(len(trials), 2)
+        for trial in trials:
+            eq_(len(trial.results), 2 if trial.pruned else 4)
+        eq_(len(sweep.trials), 2)
+        assert_greater_equal(sweep.best.L,
+                             max(t.L for t in trials if not t.pruned))
+
+        # The pilot repetitions are the first ones of the full run
+        full = Sweep(small_config(), repetitions = 4, pilot = 4)
+        for trial in trials:
+            eq_(full.run([trial.point])[0].results['L'][:2].tolist(),
+                trial.results['L'][:2].tolist())
+
+    def test_pruning(self):
+        # Points that can not learn anything are pruned by a good one
+        sweep = Sweep(small_config(), repetitions = 4, pilot = 2)
+        good, bad = sweep.run([{'H': 4}, {'H': 50}])
+        assert_false(good.pruned)
+        assert_true(bad.pruned)
+        eq_(bad.L, 0)
+
+        # Unless they have another key
+        sweep = Sweep(small_config(), repetitions = 4, pilot = 2)
+        good, bad = sweep.run([{'H': 4}, {'H': 50}], ['good', 'bad'])
+        assert_false(good.pruned)
+        assert_false(bad.pruned)
+        eq_(sweep.best, good)
+
+    def test_optimize_w(self):
+        with Workers(processes = 2) as workers:
+            sweep = Sweep(small_config(), repetitions = 3, pilot = 2,
+                          workers = workers)
+            best = sweep.optimize_w([{'H': 4}, {'H': 5}], 1, 30)
+        eq_(len(best), 2)
+        for point, trial in zip([{'H': 4}, {'H': 5}], best):
+            eq_(trial.point['H'], point['H'])
+            assert_true(1 <= trial.point['w'] <= 30)
+            assert_false(trial.pruned)
+            tried = [t.L for t in sweep.trials
+                     if t.point['H'] == point['H'] and not t.pruned]
+            eq_(trial.L, max(tried))